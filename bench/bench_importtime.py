@@ -0,0 +1,150 @@
+"""Check the import time of the subcommands of the main script.
+
+Run as "python -m bench.bench_importtime [FOLDER]" from the root folder of
+the repository, where FOLDER is the working folder with the data (by default
+the current one). Each check is run in the fresh interpreter with the flag
+"-X importtime", and the total import time and the set of imported modules
+are compared with the limits (the heavy packages must not be imported by the
+light commands). The script exits with the code 1 if any check is failed.
+
+Note:
+    The commands "folder" and "journal" are run as is (the first one in the
+    empty temporary folder). The commands "stats", "export" and "parse-wos"
+    are run in full in the temporary folder with the small synthetic data
+    (see "bench/gen.py"), where the logo is put into the download cache in
+    advance, hence no network requests are made. Their total import time
+    includes the modules imported lazily during the run. The same checks
+    (without the limits of time) are run by the tests (see
+    "tests/test_importtime.py").
+
+"""
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+
+from bench.gen import gen
+from fs import CACHE_FOLDER
+from fs import PHOTO_LOGO_URL
+
+
+FIXTURE_PAPERS = 200
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'inbima.py')
+HEAVY = ['docx', 'matplotlib', 'numpy', 'openpyxl', 'pyarrow', 'pybtex',
+    'requests', 'xlsxwriter']
+CHECKS = [
+    # name, command, limit (ms), modules that must not be imported
+    ['import', ['-c', 'import inbima'], 100, HEAVY],
+    ['folder', [SCRIPT, 'folder'], 100, HEAVY],
+    ['journal', [SCRIPT, 'journal', 'Nature'], 150,
+        [m for m in HEAVY if m != 'numpy']],
+    ['stats', [SCRIPT, 'stats'], None,
+        ['docx', 'matplotlib', 'pybtex', 'requests', 'xlsxwriter']],
+    ['export', [SCRIPT, 'export'], 1000, ['pyarrow', 'pybtex', 'xlsxwriter']],
+    ['parse-wos', [SCRIPT, 'parse-wos'], 300,
+        ['docx', 'matplotlib', 'pyarrow', 'requests']],
+]
+COMMANDS_EMPTY = ['folder']
+COMMANDS_FIXTURE = ['export', 'parse-wos', 'stats']
+
+
+def check(name, command, limit, modules_forbidden, folder):
+    """Run the command and return the list of the detected problems."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    res = subprocess.run([sys.executable, '-X', 'importtime'] + command,
+        cwd=folder, env=env, capture_output=True, text=True)
+    t, modules = parse_importtime(res.stderr)
+    problems = []
+    if res.returncode != 0:
+        lines = [line for line in res.stderr.strip().splitlines()
+            if not line.startswith('import time:')]
+        problems.append('command failed: ' + (lines[-1] if len(lines) else
+            f'exit code {res.returncode}'))
+    for module in modules_forbidden:
+        if module in modules:
+            problems.append(f'module "{module}" is imported')
+    if limit is not None and t > limit:
+        problems.append(f'import time {t:.1f} ms > {limit} ms')
+
+    text = f'> {name:<10}: {t:8.1f} ms'
+    text += f' (limit {limit} ms)' if limit is not None else ''
+    print(text + (' FAILED' if problems else ''))
+    for problem in problems:
+        print(f'    {problem}')
+    return problems
+
+
+def get_folder(name, folder, folder_empty, folder_fixture):
+    """Return the working folder for the check (see "COMMANDS_FIXTURE")."""
+    if name in COMMANDS_EMPTY:
+        return folder_empty
+    if name in COMMANDS_FIXTURE:
+        return folder_fixture
+    return folder
+
+
+def gen_fixture(folder):
+    """Generate the working folder with the synthetic data and the logo."""
+    gen(folder, FIXTURE_PAPERS)
+
+    folder_cache = os.path.join(folder, CACHE_FOLDER)
+    os.makedirs(folder_cache, exist_ok=True)
+    fpath = os.path.join(folder_cache, PHOTO_LOGO_URL.split('/')[-2])
+    with open(fpath, 'wb') as f:
+        f.write(gen_png())
+    with open(fpath + '.json', 'w') as f:
+        json.dump({'etag': None, 'time': time.time()}, f)
+
+
+def gen_png():
+    """Return the content of the png image of one white pixel."""
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data)
+        return struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', crc)
+
+    return b'\x89PNG\r\n\x1a\n' + \
+        chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0)) + \
+        chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff')) + \
+        chunk(b'IEND', b'')
+
+
+def parse_importtime(text):
+    """Return the total import time (ms) and the set of top-level modules."""
+    t = 0
+    modules = set()
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        t_self, _, name = line.split(':', 1)[1].split('|')
+        t += int(t_self) / 1000
+        modules.add(name.strip().split('.')[0])
+    return t, modules
+
+
+def run(folder='.'):
+    folder = os.path.abspath(folder)
+    problems = []
+    with tempfile.TemporaryDirectory() as folder_tmp:
+        folder_empty = os.path.join(folder_tmp, 'empty')
+        folder_fixture = os.path.join(folder_tmp, 'fixture')
+        os.makedirs(folder_empty)
+        gen_fixture(folder_fixture)
+        for name, command, limit, modules_forbidden in CHECKS:
+            problems += check(name, command, limit, modules_forbidden,
+                get_folder(name, folder, folder_empty, folder_fixture))
+
+    if len(problems):
+        print(f'\n> {len(problems)} problem(s) are found')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    run(args[0] if len(args) > 0 else '.')
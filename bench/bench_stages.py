@@ -0,0 +1,194 @@
+"""Benchmark the stages of the pipeline on the synthetic data.
+
+Run as "python -m bench.bench_stages [-n PAPERS] [-r REPEATS] [-s]" from the
+root folder of the repository. The working folder with the synthetic data
+of the given size (see "bench/gen.py") is generated in the temporary folder,
+and the time and the peak of the allocated memory are measured for stages:
+load_book (the excel database), compile_ref (the reference info on journals),
+get_journal (the exact search of journals for bibtex entries), find (the
+approximate search of journals by misspelled titles), parse_author (the
+search of team members for all authors of bibtex entries), get_papers_stat
+(the index of papers and the statistics for all team members and grants)
+and add_paper_list (the Word document with the list of all papers).
+
+The results are compared with the baselines from the file BASELINES_PATH
+for the same number of papers, and the script exits with the code 1 if the
+time or the memory of any stage is greater than the baseline more than
+THRESHOLD times. With the flag "-s" the results are saved as new baselines
+(they depend on the machine, hence they should be saved once before the
+changes of the code).
+
+"""
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+
+
+from bench.common import measure
+from bench.gen import gen
+
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+REPEATS = 3
+THRESHOLD = 1.5
+YEARS = [2017, 2018, 2019, 2020, 2021]
+
+
+def bench(papers=10000, repeats=REPEATS):
+    """Run all stages and return the dict stage -> [time, memory]."""
+    folder_cur = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        gen(folder, papers)
+        os.chdir(folder)
+        try:
+            return bench_stages(repeats)
+        finally:
+            os.chdir(folder_cur)
+
+
+def bench_stages(repeats=REPEATS):
+    from inbima import TABLES
+    from journals import Journals
+    from papers import Papers
+    from parser_wos import load_bibs
+    from parser_wos import parse_author
+    from parser_wos import TeamIndex
+    from utils import load_book
+    from word import Word
+
+    res = {}
+
+    def run(name, func):
+        res[name] = measure(func, repeats, with_memory=True, is_quiet=True)
+        print(f'> {name:<15}: {res[name][0]:8.3f} sec. '
+            f'{res[name][1]:8.1f} MB')
+
+    fpath = 'export/export_bench/cait.xlsx'
+    data = run_quiet(lambda: load_book(fpath, TABLES))
+    run('load_book', lambda: load_book(fpath, TABLES))
+
+    journals = Journals(data['journals'])
+    run('compile_ref', journals.compile_ref)
+    journals.load_ref()
+
+    uids = sorted(f.split('.')[0] for f in os.listdir('bib_wos'))
+    entries = [entry for _, _, entry in run_quiet(
+        lambda: list(load_bibs(uids)))]
+    items = [[e.fields.get('journal'), e.fields.get('issn')] for e in entries]
+    items = [[title[1:-1], (issn or '{}')[1:-1]]
+        for title, issn in items if title]
+
+    def get_journals():
+        journals.ref_sjr_items = {}
+        for title, issn in items:
+            journals.get_journal(title, issn)
+
+    run('get_journal', get_journals)
+
+    rand = random.Random(0)
+    titles = rand.sample(list(journals.get_ref_sjr().keys()), 200)
+    titles = [t[:len(t) // 2] + t[len(t) // 2 + 1:] for t in titles]
+
+    def find_journals():
+        journals.title_index = {}
+        journals.find_many(titles, journals.get_ref_sjr())
+
+    run('find', find_journals)
+
+    team_index = TeamIndex(data['team'])
+    persons = [entry.persons['author'] for entry in entries]
+    run('parse_author', lambda: [parse_author(p, team_index) for p in persons])
+
+    def get_papers_stat():
+        journals.q = {}
+        papers = Papers(data['papers'], journals)
+        papers.build_cube(YEARS)
+        for uid in data['team']:
+            papers.stat(uid, YEARS)
+        for uid in data['grants']:
+            papers.stat(years=YEARS, grant=uid)
+
+    run('get_papers_stat', get_papers_stat)
+
+    papers = Papers(data['papers'], journals)
+    stat = papers.stat(years=YEARS)
+
+    def add_paper_list():
+        word = Word(YEARS, papers.find)
+        word.add_paper_list(stat, with_links=True)
+
+    run('add_paper_list', add_paper_list)
+
+    return res
+
+
+def check(res, baselines, threshold=THRESHOLD):
+    """Compare the results with the baselines and return the problems."""
+    problems = []
+    for name, (t, memory) in res.items():
+        if not name in baselines:
+            continue
+        t_base, memory_base = baselines[name]
+        if t > t_base * threshold:
+            problems.append(f'{name}: time {t:.3f} sec. > {t_base:.3f} sec.')
+        if memory > memory_base * threshold:
+            problems.append(f'{name}: memory {memory:.1f} MB > '
+                f'{memory_base:.1f} MB')
+    return problems
+
+
+def run_quiet(func):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func()
+
+
+def load_baselines():
+    if not os.path.isfile(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH, 'r') as f:
+        return json.load(f)
+
+
+def save_baselines(baselines):
+    with open(BASELINES_PATH, 'w') as f:
+        json.dump(baselines, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    papers = 10000
+    repeats = REPEATS
+    is_save = False
+    while len(args):
+        if args[0] == '-n' and len(args) > 1:
+            papers = int(args[1])
+            args = args[2:]
+        elif args[0] == '-r' and len(args) > 1:
+            repeats = int(args[1])
+            args = args[2:]
+        elif args[0] == '-s':
+            is_save = True
+            args = args[1:]
+        else:
+            raise ValueError('Invalid arguments for script')
+
+    res = bench(papers, repeats)
+
+    baselines = load_baselines()
+    if is_save:
+        baselines[str(papers)] = res
+        save_baselines(baselines)
+        print(f'\n> Baselines are saved to "{BASELINES_PATH}"')
+    elif str(papers) in baselines:
+        problems = check(res, baselines[str(papers)])
+        for problem in problems:
+            print(f'> Regression of {problem}')
+        if len(problems):
+            sys.exit(1)
+        print('\n> There are no regressions')
+    else:
+        print(f'\n> There are no baselines for {papers} papers (use "-s")')
@@ -0,0 +1,59 @@
+"""Measure the startup of the journal query "python inbima.py -j TITLE".
+
+Run as "python -m bench.bench_startup [TITLE] [REPEATS]" from the root
+folder of the repository. Each repeat is the fresh interpreter (the cold
+start), where the import time of the "inbima" module, the time to open the
+reference info on journals ("load_ref") and the latency of the first query
+are measured separately. The reference database should be compiled before
+(it is done by the first run of any command).
+
+"""
+import json
+import subprocess
+import sys
+
+
+CODE = '''
+import json, time
+t = time.perf_counter()
+import inbima
+t_import = time.perf_counter() - t
+t = time.perf_counter()
+journals = inbima.Journals()
+journals.load_ref()
+t_load = time.perf_counter() - t
+t = time.perf_counter()
+journal = journals.get_journal({title!r})
+t_query = time.perf_counter() - t
+print(json.dumps([t_import, t_load, t_query, journal is not None]))
+'''
+LIMIT = 0.1
+
+
+def bench(title, repeats=5):
+    res = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', CODE.format(title=title)],
+            capture_output=True, text=True, check=True).stdout
+        res.append(json.loads(out.strip().splitlines()[-1]))
+
+    t_import = min(item[0] for item in res)
+    t_load = min(item[1] for item in res)
+    t_query = min(item[2] for item in res)
+    t_total = t_import + t_load + t_query
+
+    print(f'\n> Import     : {t_import*1000:8.1f} ms')
+    print(f'> Load ref   : {t_load*1000:8.1f} ms')
+    print(f'> Query      : {t_query*1000:8.1f} ms')
+    print(f'> Total      : {t_total*1000:8.1f} ms (limit {LIMIT*1000:.0f} ms)')
+    if not res[0][3]:
+        print(f'> Journal "{title}" is not found')
+    if t_total > LIMIT:
+        print('> WARNING: the startup is slower than the limit')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    title = args[0] if len(args) > 0 else 'Nature'
+    repeats = int(args[1]) if len(args) > 1 else 5
+    bench(title, repeats)
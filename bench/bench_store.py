@@ -0,0 +1,46 @@
+"""Compare the load time of the excel file and of the columnar store.
+
+Run as "python -m bench.bench_store [PATH_TO_XLSX] [REPEATS]" from the root
+folder of the repository. By default the file "cait.xlsx" from the last
+export folder is used. The tables are converted into the temporary parquet
+store, and both loaders are checked to return the same data.
+
+"""
+import os
+import sys
+import tempfile
+
+
+from bench.common import measure
+from fs import FS
+from inbima import TABLES
+from store import load_store
+from store import save_store
+from utils import load_book
+
+
+def bench(fpath, repeats=3):
+    data = load_book(fpath, TABLES)
+
+    with tempfile.TemporaryDirectory() as folder:
+        save_store(folder, data)
+        size_xlsx = os.path.getsize(fpath) / 1024**2
+        size_store = sum(os.path.getsize(os.path.join(folder, f))
+            for f in os.listdir(folder)) / 1024**2
+
+        t_xlsx = measure(lambda: load_book(fpath, TABLES), repeats)
+        t_store = measure(lambda: load_store(folder, TABLES), repeats)
+
+        if load_store(folder, TABLES) != data:
+            raise ValueError('Data loaded from the store is not the same')
+
+    print(f'\n> Excel file : {t_xlsx:8.3f} sec. ({size_xlsx:.2f} MB)')
+    print(f'> Store      : {t_store:8.3f} sec. ({size_store:.2f} MB)')
+    print(f'> Speedup    : {t_xlsx / t_store:8.1f} times')
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    fpath = args[0] if len(args) > 0 else FS().get_path('cait.xlsx')
+    repeats = int(args[1]) if len(args) > 1 else 3
+    bench(fpath, repeats)
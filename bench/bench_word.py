@@ -0,0 +1,98 @@
+"""Compare the time of the paper list building in the Word documents.
+
+Run as "python -m bench.bench_word [PAPERS] [REPEATS]" from the root folder
+of the repository. The list of random papers (with the special symbols in
+the text and with hyperlinks) is added to the document by the run-by-run
+mode and by the bulk mode of "Word.add_paper_list", and the xml of both
+documents is checked to be the same.
+
+"""
+import io
+import random
+import sys
+import zipfile
+
+
+from bench.common import measure
+from word import Word
+
+
+YEARS = [2017, 2018, 2019, 2020, 2021]
+
+
+def bench(count=1000, repeats=3):
+    papers = gen_papers(count)
+    stat = get_stat(papers)
+
+    def get_papers(author=None, year=None, q=None, grant=None):
+        return {paper['title']: paper for paper in papers
+            if int(paper['year']) == year and paper['q'] == q}
+
+    def build(is_bulk):
+        word = Word(YEARS, get_papers)
+        word.add_paper_list(stat, author='#a1', with_links=True,
+            is_bulk=is_bulk)
+        return word
+
+    t_runs = measure(lambda: build(False), repeats)
+    t_bulk = measure(lambda: build(True), repeats)
+
+    if get_xml(build(False)) != get_xml(build(True)):
+        raise ValueError('Documents built in different modes are not equal')
+
+    print(f'\n> Papers     : {count}')
+    print(f'> Runs mode  : {t_runs:8.3f} sec.')
+    print(f'> Bulk mode  : {t_bulk:8.3f} sec.')
+    print(f'> Speedup    : {t_runs / t_bulk:8.1f} times')
+
+
+def gen_papers(count, seed=42):
+    random.seed(seed)
+    texts = ['Deep & <fast> learning', ' Tensor\ttrains ', 'Quantum\nnets',
+        'Low-rank "approximation"', 'Обучение нейросетей']
+
+    papers = []
+    for i in range(count):
+        authors = [f'Author{j} A.' for j in range(random.randint(1, 8))]
+        authors_parsed = [f'#a{j}' if random.random() < 0.3 else a
+            for j, a in enumerate(authors)]
+        papers.append({
+            'title': f'{random.choice(texts)} {i}',
+            'year': str(random.choice(YEARS)),
+            'q': random.choice([1, 2, 0]),
+            'authors': ', '.join(authors),
+            'authors_parsed': ', '.join(authors_parsed),
+            'journal': f'Journal {random.randint(1, 50)}',
+            'volume': str(random.randint(1, 30)),
+            'number': random.choice(['', str(random.randint(1, 12))]),
+            'pages': f'{i}-{i+10}',
+            'screen': random.choice(['', f'https://site.org/{i % 100}']),
+            'journal_object': {
+                'screen_wos': random.choice(['', 'https://wos.org/j']),
+            },
+        })
+    return papers
+
+
+def get_stat(papers):
+    stat = {year: {'q1': 0, 'q2': 0, 'q0': 0} for year in YEARS}
+    stat['total'] = {'q1': 0, 'q2': 0, 'q0': 0}
+    for paper in papers:
+        stat[int(paper['year'])][f'q{paper["q"]}'] += 1
+        stat['total'][f'q{paper["q"]}'] += 1
+    return stat
+
+
+def get_xml(word):
+    f = io.BytesIO()
+    word.document.save(f)
+    with zipfile.ZipFile(f) as z:
+        return [z.read('word/document.xml'),
+            z.read('word/_rels/document.xml.rels')]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    count = int(args[0]) if len(args) > 0 else 1000
+    repeats = int(args[1]) if len(args) > 1 else 3
+    bench(count, repeats)
@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmark scripts."""
+import contextlib
+import io
+import time
+import tracemalloc
+
+
+def measure(func, repeats=3, with_memory=False, is_quiet=False):
+    """Measure the time (and the memory) of the function call.
+
+    Args:
+        func (callable): the function to call (without arguments).
+        repeats (int): the number of calls (the minimum time is returned).
+        with_memory (bool): if True, then the function is called once more
+            with the memory tracing, and the peak of the traced memory is
+            returned (it is not used for the timing since the tracing slows
+            down the code).
+        is_quiet (bool): if True, then the output of the function is hidden.
+
+    Returns:
+        float or (float, float): the time in seconds, or the time and the
+        peak of the allocated memory in MB (if "with_memory" is True).
+
+    """
+    out = io.StringIO() if is_quiet else None
+    with contextlib.redirect_stdout(out) if is_quiet else \
+            contextlib.nullcontext():
+        times = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - t)
+
+        if not with_memory:
+            return min(times)
+
+        tracemalloc.start()
+        try:
+            func()
+            memory = tracemalloc.get_traced_memory()[1] / 1024**2
+        finally:
+            tracemalloc.stop()
+
+    return min(times), memory
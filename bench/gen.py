@@ -0,0 +1,286 @@
+"""Generators of the synthetic data for benchmarks.
+
+Run as "python -m bench.gen FOLDER [PAPERS]" from the root folder of the
+repository. The working folder FOLDER is created with the same structure as
+the root folder of the repository: the excel database "cait.xlsx" in the
+export folder "export/export_bench", the Scimago-shaped csv files in the
+folder "journals" and the WoS-shaped bibtex files in the folder "bib_wos".
+Hence all scripts may be run in this folder as is (e.g., "python ../inbima.py
+stats" or "python ../parser_wos.py"), the photos are not generated.
+
+"""
+import csv
+import os
+import random
+import sys
+
+
+YEARS_REF = [2019, 2020, 2021]
+YEARS_PAPERS = [2016, 2017, 2018, 2019, 2020, 2021, 2022]
+SYLLABLES = ['ba', 'be', 'vo', 'go', 'de', 'ka', 'ko', 'li', 'lo', 'ma',
+    'mi', 'no', 'pa', 'ra', 'ro', 'se', 'ta', 'to', 'fe', 'che', 'sha', 'zu']
+NAMES = ['Alexander', 'Andrei', 'Anna', 'Dmitry', 'Evgeny', 'Gleb', 'Ivan',
+    'Julia', 'Maria', 'Maxim', 'Mikhail', 'Olga', 'Roman', 'Sergey', 'Victor']
+WORDS = ['journal', 'of', 'applied', 'mathematics', 'physics', 'review',
+    'letters', 'transactions', 'on', 'signal', 'processing', 'neural',
+    'networks', 'machine', 'learning', 'computational', 'science',
+    'chemistry', 'biology', 'international', 'advances', 'research',
+    'quantum', 'information', 'systems', 'control', 'theory']
+CATEGORIES = ['Applied Mathematics', 'Artificial Intelligence', 'Chemistry',
+    'Computer Science Applications', 'Mathematics (miscellaneous)',
+    'Physics and Astronomy (miscellaneous)', 'Signal Processing']
+BOOK_FIELDS = {
+    'team': ['Id', 'Surname', 'Name', 'Photo', 'Active', 'Lead', 'Degree',
+        'Position'],
+    'grants': ['Id', 'Number', 'Source', 'Head', 'Acknowledgement'],
+    'journals': ['Title', 'ISSN', 'SJR Q1', 'SJR Q2', 'Screen WoS'],
+    'papers': ['Title', 'Year', 'Authors', 'Journal', 'Volume', 'Number',
+        'Pages', 'Site', 'PDF', 'Screen', 'DOI', 'Grant', 'Grant_str',
+        'Authors Parsed', 'Note'],
+    'inbima': ['Id', 'Kind', 'Authors', 'Grants', 'Years', 'Quartiles',
+        'Format'],
+}
+
+
+def gen(folder, papers=10000, seed=0):
+    """Generate the working folder with all synthetic data.
+
+    Args:
+        folder (str): the path to the working folder.
+        papers (int): the number of papers in the excel database (the same
+            number of entries is generated for the bibtex files).
+        seed (int): the seed for the random generator.
+
+    Returns:
+        dict: the generated team, grants and journals (the lists of dicts).
+
+    """
+    rand = random.Random(seed)
+
+    count_team = max(10, papers // 100)
+    count_grants = max(5, papers // 1000)
+    count_journals = max(100, papers // 10)
+    count_ref = max(1000, count_journals * 5)
+
+    team = gen_team(rand, count_team)
+    grants = gen_grants(rand, count_grants, team)
+    journals = gen_journals(rand, count_ref)
+
+    for folder_sub in ['export/export_bench', 'journals', 'bib_wos']:
+        os.makedirs(os.path.join(folder, folder_sub), exist_ok=True)
+
+    for year in YEARS_REF:
+        fpath = os.path.join(folder, 'journals', f'scimagojr {year}.csv')
+        gen_sjr(rand, fpath, journals)
+
+    fpath = os.path.join(folder, 'export/export_bench/cait.xlsx')
+    gen_book(rand, fpath, papers, team, grants, journals[:count_journals])
+
+    gen_bibs(rand, os.path.join(folder, 'bib_wos'), papers, team, grants,
+        journals[:count_journals])
+
+    return {'team': team, 'grants': grants, 'journals': journals}
+
+
+def gen_bibs(rand, folder, count, team, grants, journals):
+    """Generate WoS-shaped bibtex files (one file for each team member)."""
+    files = {person['id']: [] for person in team}
+    for i in range(count):
+        authors = gen_authors(rand, team)
+        person = rand.choice([a for a in authors if 'id' in a] or team)
+        files[person['id']].append(gen_entry(rand, i, authors, grants,
+            journals))
+
+    for uid, entries in files.items():
+        fpath = os.path.join(folder, uid[1:] + '.bib')
+        with open(fpath, 'w', encoding='utf-8') as f:
+            f.write('\ufeff\n' + '\n'.join(entries))
+
+
+def gen_authors(rand, team):
+    authors = rand.sample(team, rand.randint(1, 4))
+    for _ in range(rand.randint(0, 4)):
+        authors.append({'surname': gen_word(rand), 'name': rand.choice(NAMES)})
+    rand.shuffle(authors)
+    return authors
+
+
+def gen_book(rand, fpath, count, team, grants, journals):
+    """Generate the excel database (the workbook like "cait.xlsx")."""
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+
+    ws = wb.create_sheet('team')
+    ws.append(BOOK_FIELDS['team'])
+    for person in team:
+        ws.append([person['id'], person['surname'], person['name'], None,
+            person['active'], person['lead'], 'PhD', 'Researcher'])
+
+    ws = wb.create_sheet('grants')
+    ws.append(BOOK_FIELDS['grants'])
+    for grant in grants:
+        ws.append([grant['id'], grant['number'], 'RSF', grant['head'],
+            f'The work was supported by the grant {grant["number"]}.'])
+
+    ws = wb.create_sheet('journals')
+    ws.append(BOOK_FIELDS['journals'])
+    for i, journal in enumerate(journals):
+        ws.append([journal['title'], journal['issn'],
+            '; '.join(journal['q1']) or None, '; '.join(journal['q2']) or ' ',
+            f'https://wos.org/journal/{i}' if i % 3 else None])
+
+    ws = wb.create_sheet('papers')
+    ws.append(BOOK_FIELDS['papers'])
+    for i in range(count):
+        authors = gen_authors(rand, team)
+        grants_paper = rand.sample(grants, rand.randint(0, 2))
+        ws.append([
+            gen_title(rand, i),
+            str(rand.choice(YEARS_PAPERS)),
+            ', '.join(f'{a["surname"]} {a["name"][0]}.' for a in authors),
+            rand.choice(journals)['title'],
+            str(rand.randint(1, 50)) if i % 4 else None,
+            str(rand.randint(1, 12)) if i % 5 else None,
+            f'{i}-{i + 10}',
+            None,
+            None,
+            f'https://site.org/{i}' if i % 2 else None,
+            f'10.1000/bench.{i}',
+            ', '.join(g['id'] for g in grants_paper) or ' ',
+            None,
+            ', '.join(a.get('id') or f'{a["surname"]} {a["name"][0]}.'
+                for a in authors),
+            None,
+        ])
+
+    ws = wb.create_sheet('inbima')
+    ws.append(BOOK_FIELDS['inbima'])
+
+    wb.save(fpath)
+
+
+def gen_entry(rand, i, authors, grants, journals):
+    """Generate the WoS-shaped bibtex entry (article or conference paper)."""
+    title = gen_title(rand, i)
+    fields = [
+        ['Author', ' and '.join(f'{a["surname"]}, {a["name"]}'
+            for a in authors)],
+        ['Title', '{' + title + '}'],
+    ]
+
+    is_conf = rand.random() < 0.1
+    if is_conf:
+        fields.append(['Booktitle', '{PROCEEDINGS OF ' + title.upper() + '}'])
+    else:
+        journal = rand.choice(journals)
+        title_journal = journal['title']
+        if rand.random() < 0.5:
+            title_journal = title_journal.upper()
+        if rand.random() < 0.05:
+            title_journal = 'UNKNOWN ' + title_journal.upper()
+        fields.append(['Journal', '{' + title_journal + '}'])
+        if rand.random() < 0.8:
+            fields.append(['ISSN', '{' + journal['issn'] + '}'])
+
+    fields.append(['Year', '{' + str(rand.choice(YEARS_PAPERS)) + '}'])
+    fields.append(['Volume', '{' + str(rand.randint(1, 50)) + '}'])
+    fields.append(['Pages', '{' + f'{i}-{i + 10}' + '}'])
+    fields.append(['DOI', '{' + f'10.1000/bench.{i}' + '}'])
+
+    grants_paper = rand.sample(grants, rand.randint(0, 2))
+    if len(grants_paper):
+        text = 'This work was supported by '
+        text += ' and '.join(f'the grant No. {g["number"]}'
+            for g in grants_paper)
+        fields.append(['Funding-Text', '{' + text + '.}'])
+
+    fields.append(['Unique-ID', '{' + f'WOS:{i:015d}' + '}'])
+
+    kind = 'inproceedings' if is_conf else 'article'
+    text = '@' + kind + '{ WOS:' + f'{i:015d}' + ',\n'
+    text += ',\n'.join(f'{name} = {{{value}}}' for name, value in fields)
+    return text + '\n}\n'
+
+
+def gen_grants(rand, count, team):
+    grants = []
+    for i in range(count):
+        grants.append({
+            'id': '#megagrant1' if i == 0 else f'#grant{i}',
+            'number': f'{rand.randint(14, 22)}-{rand.randint(11, 79)}-'
+                f'{rand.randint(10000, 99999)}',
+            'head': rand.choice(team)['id'],
+        })
+    return grants
+
+
+def gen_journals(rand, count):
+    journals = []
+    for i in range(count):
+        categories = rand.sample(CATEGORIES, rand.randint(1, 3))
+        quartiles = [rand.choice(['Q1', 'Q2', 'Q3', 'Q4', None])
+            for _ in categories]
+        journals.append({
+            'title': gen_title(rand, i, WORDS).title(),
+            'issn': f'{rand.randint(1000, 9999)}-{rand.randint(1000, 9999)}',
+            'categories': list(zip(categories, quartiles)),
+            'q1': [c for c, q in zip(categories, quartiles) if q == 'Q1'],
+            'q2': [c for c, q in zip(categories, quartiles) if q == 'Q2'],
+        })
+    return journals
+
+
+def gen_sjr(rand, fpath, journals):
+    """Generate the Scimago-shaped csv file (see "Journals.load_ref_sjr")."""
+    with open(fpath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(['Rank', 'Sourceid', 'Title', 'Type', 'Issn', 'SJR',
+            'SJR Best Quartile', 'H index', 'Total Docs.', 'Total Docs. (3years)',
+            'Total Refs.', 'Total Cites (3years)', 'Citable Docs. (3years)',
+            'Cites / Doc. (2years)', 'Ref. / Doc.', 'Country', 'Region',
+            'Publisher', 'Coverage', 'Categories'])
+        for i, journal in enumerate(journals):
+            categories = '; '.join(c + (f' ({q})' if q else '')
+                for c, q in journal['categories'])
+            issn = journal['issn'].replace('-', '')
+            if i % 2:
+                issn += f', {rand.randint(1000, 9999)}{rand.randint(100, 999)}X'
+            writer.writerow([i + 1, 10000 + i, journal['title'], 'journal',
+                issn, f'{rand.random() * 5:.3f}'.replace('.', ','), 'Q1',
+                rand.randint(1, 300), 0, 0, 0, 0, 0, 0, 0, 'Russian Federation',
+                'Eastern Europe', 'Publisher', '2000-2021', categories])
+
+
+def gen_team(rand, count):
+    team = []
+    surnames = set()
+    while len(team) < count:
+        surname = gen_word(rand).capitalize()
+        if surname in surnames:
+            continue
+        surnames.add(surname)
+        team.append({
+            'id': '#' + surname.lower(),
+            'surname': surname,
+            'name': rand.choice(NAMES),
+            'active': rand.choice(['Yes', 'No']),
+            'lead': 'Yes' if rand.random() < 0.2 else 'No',
+        })
+    return team
+
+
+def gen_title(rand, i, words=WORDS):
+    return ' '.join(rand.choice(words) for _ in range(rand.randint(2, 6))) + \
+        f' {i}'
+
+
+def gen_word(rand):
+    return ''.join(rand.choice(SYLLABLES) for _ in range(rand.randint(2, 4)))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if len(args) == 0:
+        raise ValueError('Invalid arguments for script (FOLDER is required)')
+    gen(args[0], int(args[1]) if len(args) > 1 else 10000)
@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+
+
+from papers import split_list
+from store import dump_value
+from store import parse_value
+from utils import log
+
+
+DB_COLUMNS = ['pos', 'year_num', 'q']
+DB_TYPES = {float, int, str}
+DB_VERSION = 3
+
+
+class PapersDB():
+    def __init__(self, data={}, journals=None, fpath=None, key=None):
+        """Index of papers in the SQLite database with the same interface as
+        the in-memory index "Papers" (the methods "find" and "stat").
+
+        Args:
+            data (dict or function): the table of papers (as it is loaded by
+                "load_book" or "load_store", i.e., from the excel file or
+                from the output of the WoS parser), or the function which
+                returns it. The function is called only if the database is
+                rebuilt, hence the actual database is used without loading
+                the papers into memory.
+            journals (Journals): the journals info for the quartiles.
+            fpath (str): the path to the database file.
+            key (str): the key (hash) of the source data, e.g., of the excel
+                file (see "load_book_cached") or of the store files (see
+                "hash_store"). If the database is built for the same key,
+                then it is used as is, otherwise it is rebuilt from the data.
+
+        """
+        self.journals = journals
+        self.fpath = fpath
+        self.key = key
+        self.db = None
+        self.fields = []
+        self.encoded = []
+
+        if not self.is_actual():
+            self.build(data() if callable(data) else data)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['db'] = None # The connection to database can not be pickled
+        return state
+
+    def __len__(self):
+        rows = self.get_db().execute('SELECT COUNT(*) FROM papers')
+        return rows.fetchone()[0]
+
+    def build(self, data):
+        """Build the database of papers (it is called if data is changed).
+
+        Note:
+            The papers are saved into the table "papers" with one column for
+            each field of the papers table (e.g., "title", "year", "journal",
+            "authors_parsed"), hence the papers may be filtered by any field
+            with the plain SQL. The values of fields are saved as is (numbers
+            and strings), and the columns with values of other types (e.g.,
+            dates) are saved with the typed encoding of the columnar store
+            (see "dump_value"), hence "find" returns the same values as
+            "Papers.find". The table also has the columns of the position of
+            the paper, the year as the number and the quartile class of the
+            journal (it is computed once while building). The authors and
+            grants of papers are saved into the link tables "paper_authors"
+            and "paper_grants". All tables are indexed, hence the requests
+            from "find" and "stat" are reduced to the indexed SQL queries
+            (the statistics are computed by "GROUP BY").
+
+        """
+        self.close()
+        if os.path.isfile(self.fpath):
+            os.remove(self.fpath)
+
+        fields = {}
+        for paper in data.values():
+            fields.update(dict.fromkeys(paper.keys()))
+        self.fields = list(fields)
+        for field in self.fields:
+            if field in DB_COLUMNS:
+                log(f'Field "{field}" of papers is reserved for database',
+                    'err')
+
+        self.encoded = []
+        for field in self.fields:
+            kinds = {type(paper[field]) for paper in data.values()
+                if field in paper}
+            if not kinds <= DB_TYPES:
+                self.encoded.append(field)
+
+        columns = DB_COLUMNS + self.fields
+        marks = ', '.join(['?'] * len(columns))
+
+        db = sqlite3.connect(self.fpath)
+        with db:
+            db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            db.execute('CREATE TABLE papers (pos INTEGER PRIMARY KEY, '
+                'year_num INTEGER, q INTEGER, ' +
+                ', '.join(f'"{field}"' for field in self.fields) + ')')
+            db.execute('CREATE TABLE paper_authors (uid TEXT, pos INTEGER)')
+            db.execute('CREATE TABLE paper_grants (uid TEXT, pos INTEGER)')
+
+            rows = []
+            rows_author = []
+            rows_grant = []
+            for pos, paper in enumerate(data.values()):
+                row = [pos, int(paper['year']), self.get_q(paper)]
+                for field in self.fields:
+                    value = paper.get(field)
+                    if value is not None and field in self.encoded:
+                        value = dump_value(value)
+                    row.append(value)
+                rows.append(row)
+                for uid in split_list(paper.get('authors_parsed')):
+                    rows_author.append([uid, pos])
+                for uid in split_list(paper.get('grant')):
+                    rows_grant.append([uid, pos])
+
+            db.executemany(f'INSERT INTO papers VALUES ({marks})', rows)
+            db.executemany('INSERT INTO paper_authors VALUES (?, ?)',
+                rows_author)
+            db.executemany('INSERT INTO paper_grants VALUES (?, ?)',
+                rows_grant)
+
+            db.execute('CREATE INDEX papers_year ON papers (year_num, q)')
+            db.execute('CREATE INDEX papers_journal ON papers (journal)')
+            db.execute('CREATE INDEX paper_authors_uid '
+                'ON paper_authors (uid, pos)')
+            db.execute('CREATE INDEX paper_grants_uid '
+                'ON paper_grants (uid, pos)')
+
+            db.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ['version', str(DB_VERSION)], ['key', str(self.key)],
+                ['fields', json.dumps(self.fields)],
+                ['encoded', json.dumps(self.encoded)]])
+
+        db.close()
+        log(f'Database of papers "{self.fpath}" is built', 'res')
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def find(self, author=None, year=None, q=None, grant=None):
+        res = {}
+        columns = ', '.join(f'p."{field}"' for field in self.fields)
+        sql, args = self.get_sql(columns, author, year, q, grant)
+        for values in self.get_db().execute(sql + ' ORDER BY p.pos', args):
+            paper = {}
+            for field, value in zip(self.fields, values):
+                if value is None:
+                    continue
+                if field in self.encoded:
+                    value = parse_value(value)
+                paper[field] = value
+            paper['journal_object'] = self.journals.data[paper['journal']]
+            res[paper['title']] = paper
+        return res
+
+    def find_titles(self, author=None, year=None, q=None, grant=None):
+        sql, args = self.get_sql('p.title', author, year, q, grant)
+        rows = self.get_db().execute(sql + ' ORDER BY p.pos', args)
+        return [title for title, in rows]
+
+    def get_db(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.fpath)
+        return self.db
+
+    def get_q(self, paper):
+        return self.journals.get_q(paper['journal'], int(paper['year']))
+
+    def get_sql(self, columns, author=None, year=None, q=None, grant=None):
+        sql = f'SELECT {columns} FROM papers p'
+        args = []
+        if author:
+            sql += ' JOIN paper_authors a ON a.pos = p.pos AND a.uid = ?'
+            args.append(author)
+        if grant:
+            sql += ' JOIN paper_grants g ON g.pos = p.pos AND g.uid = ?'
+            args.append(grant)
+
+        where = []
+        if year:
+            where.append('p.year_num = ?')
+            args.append(int(year))
+        if q is not None:
+            where.append('p.q = ?')
+            args.append(q)
+        if len(where):
+            sql += ' WHERE ' + ' AND '.join(where)
+
+        return sql, args
+
+    def is_actual(self):
+        """Check if the database is built for the key (and load its fields)."""
+        if not self.fpath or not os.path.isfile(self.fpath):
+            return False
+
+        db = sqlite3.connect(self.fpath)
+        try:
+            meta = dict(db.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            meta = {}
+        db.close()
+
+        if meta.get('version') != str(DB_VERSION) or \
+                meta.get('key') != str(self.key):
+            return False
+        self.fields = json.loads(meta['fields'])
+        self.encoded = json.loads(meta['encoded'])
+        return True
+
+    def stat(self, author=None, years=[], grant=None):
+        counts = {}
+        if len(years):
+            sql, args = self.get_sql('p.year_num, p.q, COUNT(*)', author,
+                grant=grant)
+            sql += ' WHERE p.year_num IN (' + ', '.join('?' * len(years)) + ')'
+            sql += ' GROUP BY p.year_num, p.q'
+            args += [int(year) for year in years]
+            for year, q, count in self.get_db().execute(sql, args):
+                counts[(year, q)] = count
+
+        res = {}
+        for year in years:
+            q1 = counts.get((int(year), 1), 0)
+            q2 = counts.get((int(year), 2), 0)
+            q0 = counts.get((int(year), 0), 0)
+            res[year] = {'q1': q1, 'q2': q2, 'q0': q0, 'total': q1 + q2 + q0}
+        res['total'] = {
+            'q1': sum(res[year]['q1'] for year in years),
+            'q2': sum(res[year]['q2'] for year in years),
+            'q0': sum(res[year]['q0'] for year in years),
+            'total': sum(res[year]['total'] for year in years),
+        }
+        return res
+
+
+if __name__ == '__main__':
+    # Build the database from the output of the WoS parser (saved by the
+    # command "python parser_wos.py -p") as "python db.py [FOLDER] [PATH]":
+    from journals import Journals
+    from store import hash_store
+    from store import load_store
+    from utils import hash_data
+    import sys
+
+    args = sys.argv[1:]
+    folder = args[0] if len(args) > 0 else './parser_wos_result'
+    fpath = args[1] if len(args) > 1 else './parser_wos_result.db'
+
+    names = ['papers_parsed', 'journals_parsed']
+    data = load_store(folder, names)
+    journals = Journals(data['journals_parsed'])
+    journals.load_ref()
+    key = hash_data([hash_store(folder, names), journals.get_ref_db_meta()])
+    PapersDB(data['papers_parsed'], journals, fpath, key)
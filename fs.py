@@ -1,12 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import json
 import os
-import requests
+import shutil
+import threading
+import time
 
 
 from utils import log
 
 
+CACHE_AGE_MAX = 7 * 24 * 60 * 60
+CACHE_FOLDER = './export/cache'
+DOWNLOAD_WORKERS = 8
 EXPORT_FOLDER = './export'
+GDRIVE_URL = 'https://docs.google.com/uc?export=download'
 PHOTO_LOGO_URL = 'https://drive.google.com/file/d/1hApCr3FnpZedkaJnQkRA4GRoeKY-HZce/view?usp=sharing'
 
 
@@ -33,43 +41,151 @@ class FS():
         if not os.path.isdir(tmp_dir):
             os.mkdir(tmp_dir)
 
-        self.downloaded = []
-
-    def get_path(self, file_name):
-        return os.path.join(self.folder, file_name)
+        if not os.path.isdir(CACHE_FOLDER):
+            os.mkdir(CACHE_FOLDER)
+
+        self.downloaded = set()
+        self.fetched = 0 # The number of files requested from the server
+        self.session = None
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def download(self, url, file_path):
+        """Download the file from Google Drive using the persistent cache.
+
+        Note:
+            The downloaded files are saved in the CACHE_FOLDER (it is shared
+            by all export folders) with the ETag and the time of the last
+            check. If the cached file is older than CACHE_AGE_MAX seconds,
+            then it is revalidated by the conditional request, and it is
+            downloaded again only if it was changed. The same file (e.g., the
+            same photo of different persons) is processed by one thread at a
+            time (see "get_lock"), hence it is downloaded only once.
+
+        """
+        uid = url.split('/')[-2]
+        cache_path = os.path.join(CACHE_FOLDER, uid)
+        meta_path = cache_path + '.json'
+
+        with self.get_lock(uid):
+            meta = {}
+            if os.path.isfile(cache_path) and os.path.isfile(meta_path):
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+
+            is_cached = time.time() - meta.get('time', 0) <= CACHE_AGE_MAX
+            if not is_cached:
+                etag = gdrive_download(uid, cache_path, self.get_session(),
+                    meta.get('etag'))
+                with self.locks_lock:
+                    self.fetched += 1
+                with open(meta_path + '.tmp', 'w') as f:
+                    json.dump({'etag': etag, 'time': time.time()}, f)
+                os.replace(meta_path + '.tmp', meta_path)
+
+            shutil.copyfile(cache_path, file_path)
+
+        self.downloaded.add(file_path)
+        return is_cached
 
     def download_photo(self, name, url):
         if not name or not url:
             return
         file_path = self.get_path(f'tmp/{name}.jpg')
         if not file_path in self.downloaded:
-            gdrive_download(url.split('/')[-2], file_path)
-            self.downloaded.append(file_path)
-            log(f'Photo of person "{name}" is downloaded', 'res')
+            is_cached = self.download(url, file_path)
+            text = ' (from cache)' if is_cached else ''
+            log(f'Photo of person "{name}" is downloaded' + text, 'res')
         return file_path
 
     def download_photo_logo(self):
         file_path = self.get_path('tmp/cait.jpg')
         if not file_path in self.downloaded:
-            gdrive_download(PHOTO_LOGO_URL.split('/')[-2], file_path)
-            self.downloaded.append(file_path)
-            log('Logo photo is downloaded', 'res')
+            is_cached = self.download(PHOTO_LOGO_URL, file_path)
+            text = ' (from cache)' if is_cached else ''
+            log('Logo photo is downloaded' + text, 'res')
         return file_path
 
+    def download_photos(self, persons, workers=DOWNLOAD_WORKERS):
+        """Download the logo and photos of persons in parallel threads.
+
+        Args:
+            persons (list): the list of pairs (name, url) for persons.
+            workers (int): the maximum number of concurrent downloads.
+
+        Returns:
+            dict: the errors of failed downloads by the name of the person
+            (the name is None for the logo). The failed download does not
+            stop others, hence only the reports which need the failed photo
+            should be skipped by the caller.
+
+        """
+        persons = {name: url for name, url in persons if name and url}
+
+        self.get_session() # The session is shared by threads
+
+        errors = {}
+        with ThreadPoolExecutor(workers) as executor:
+            futures = {None: executor.submit(self.download_photo_logo)}
+            for name, url in persons.items():
+                futures[name] = executor.submit(self.download_photo, name, url)
+            for name, future in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[name] = e
+                    text = 'logo' if name is None else f'person "{name}"'
+                    log(f'Photo of {text} is not downloaded ({e!r})', 'wrn')
+        return errors
+
+    def get_lock(self, uid):
+        """Return the lock for the file with the given id in the cache."""
+        with self.locks_lock:
+            return self.locks.setdefault(uid, threading.Lock())
+
+    def get_path(self, file_name):
+        return os.path.join(self.folder, file_name)
+
+    def get_session(self):
+        from requests.adapters import HTTPAdapter
+        import requests
 
-def gdrive_download(uid, destination, chunk_size=32768):
-    URL = "https://docs.google.com/uc?export=download"
+        if self.session is None:
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_WORKERS,
+                pool_maxsize=DOWNLOAD_WORKERS)
+            self.session = requests.Session()
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        return self.session
 
-    session = requests.Session()
-    response = session.get(URL, params = { 'id' : uid }, stream = True)
+
+def gdrive_download(uid, destination, session=None, etag=None,
+                    chunk_size=32768):
+    import requests
+
+    session = session or requests.Session()
+    headers = {'If-None-Match': etag} if etag else {}
+
+    params = { 'id' : uid }
+    response = session.get(GDRIVE_URL, params=params, headers=headers,
+        stream=True)
 
     for key, value in response.cookies.items():
         if key.startswith('download_warning'):
             params = { 'id' : uid, 'confirm' : value }
-            response = session.get(URL, params = params, stream = True)
+            response = session.get(GDRIVE_URL, params=params, headers=headers,
+                stream=True)
             break
 
-    with open(destination, 'wb') as f:
+    if response.status_code == 304 and os.path.isfile(destination):
+        return etag
+
+    response.raise_for_status()
+
+    with open(destination + '.tmp', 'wb') as f:
         for chunk in response.iter_content(chunk_size):
             if chunk:
                 f.write(chunk)
+    os.replace(destination + '.tmp', destination)
+
+    return response.headers.get('ETag')
@@ -1,181 +1,555 @@
-import matplotlib.pyplot as plt
-import openpyxl
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
 import sys
 
 
+from db import PapersDB
 from fs import FS
 from journals import Journals
-from utils import load_sheet
+from papers import Papers
+from store import get_store_mtime
+from store import hash_store
+from store import is_store
+from store import load_store
+from store import save_store
+from tasks import get_job_name
+from tasks import Tasks
+from tasks import TASK_QUARTILES
+from utils import collect
+from utils import hash_data
+from utils import load_book_cached
 from utils import log
-from word import Word
-
-
+from utils import LogError
+from utils import PROFILE
+from utils import save_profile
+from utils import span
+from utils import Span
+
+
+DB_PATH = 'tmp/cait.db'
+ERRORS_FILE = 'errors.json'
+STORE_FOLDER = 'cait'
+TABLES = ['team', 'grants', 'papers', 'journals', 'inbima']
+COMMANDS = ['export', 'folder', 'journal', 'parse-wos', 'stats', 'store']
+COMMAND_FLAGS = {
+    '-d': ['export', '-d'],
+    '-f': ['folder'],
+    '-j': ['journal'],
+    '-p': ['store'],
+    '-w': ['export', '-w'],
+}
+WORKERS = 1
 YEARS = [2017, 2018, 2019, 2020, 2021]
+WORKER = {}
 
 
 class InBiMa():
-    def __init__(self, is_new_folder=False):
+    def __init__(self, is_new_folder=False, workers=WORKERS, with_db=False,
+                 with_tasks=True, is_retry=False, is_strict=False):
         self.fs = FS(is_new_folder)
         if is_new_folder: return
 
-        self.wb = openpyxl.load_workbook(self.fs.get_path('cait.xlsx'))
-        log('Excel file is opened', 'res')
-
-        self.team = load_sheet(self.wb['team'])
-        self.grants = load_sheet(self.wb['grants'])
-        self.papers = load_sheet(self.wb['papers'])
-        self.journals = Journals(load_sheet(self.wb['journals']))
-        # self.journals_ref = self.load_journals_ref()
-        self.task = {
-            'authors': ['#cichocki'],
-            'grants': ['#megagrant1'],
-        }
+        self.workers = workers
+        self.is_strict = is_strict
+        self.cache = {}
+        self.errors = []
+
+        with span('load_data', with_db=with_db) as sp:
+            # With the database the papers are loaded only to rebuild it
+            names = [n for n in TABLES if not with_db or n != 'papers']
+            data, key_data = self.load_data(names)
+            sp.count = len(data.get('papers', {}))
+
+        with span('build_index', with_db=with_db) as sp:
+            self.team = data['team']
+            self.grants = data['grants']
+            self.journals = Journals(data['journals'])
+            self.journals.load_ref()
+            if with_db:
+                key = hash_data([key_data, self.journals.get_ref_db_meta()])
+                self.papers = PapersDB(
+                    lambda: self.load_data(['papers'])[0]['papers'],
+                    self.journals, self.fs.get_path(DB_PATH), key)
+            else:
+                self.papers = Papers(data['papers'], self.journals)
+            self.tasks = Tasks(data['inbima'], self.team, self.grants, YEARS,
+                is_strict)
+            sp.count = len(self.papers)
         log('Excel file is parsed', 'res')
 
-        # log('Journal info is loaded', 'res')
+        if is_retry:
+            self.load_errors()
 
-        for uid in self.team.keys():
-            self.task['authors'] = [uid]
-            self.export_word_cv()
-        self.export_grant_papers()
-        self.export_stat()
+        if with_tasks:
+            self.run_tasks()
 
-    def export_word_cv(self):
-        if len(self.task.get('authors', [])) != 1:
-            text = 'export_word_cv (task should contain only one author)'
-            log(text, 'err')
-            return
+    def add_error(self, job, e):
+        error = str(e) if isinstance(e, LogError) else repr(e)
+        self.errors.append({'job': job, 'error': error})
+        log(f'Report "{get_job_name(job, YEARS)}" is failed ({error})', 'wrn')
+
+    def export_job(self, job):
+        """Export the report (CV, papers of the grant or plot) for the job."""
+        if job['kind'] == 'cv':
+            func, info = self.export_word_cv, {'uid': job['uid']}
+        elif job['kind'] == 'grant':
+            func, info = self.export_grant_papers, {'uid': job['uid']}
+        else:
+            func, info = self.export_stat, {'format': job['format']}
 
-        person = self.team.get(self.task['authors'][0])
+        with span(func.__name__, **info) as sp:
+            func(job)
+            sp.count = self.get_job_count(job)
+
+    def export_word_cv(self, job):
+        person = self.team.get(job['uid'])
         if person is None:
             text = 'export_word_cv (invalid team member uid in task)'
             log(text, 'err')
             return
 
-        uid = person['id']
-        stat = self.get_papers_stat(uid, YEARS)
-        photo_logo = self.fs.download_photo_logo()
-        photo_person = self.fs.download_photo(uid[1:], person.get('photo'))
-
-        self.word = Word(YEARS, self.get_papers)
-        self.word.add_person_info(person, photo_person, photo_logo)
-        self.word.add_person_stat(stat)
-        self.word.add_note(is_grant=True)
-        self.word.add_break()
-        self.word.add_paper_list(stat, author=person['id'])
-
-        fname = 'CAIT_' + person['surname'] + '_' + person['name'] + '.docx'
-        fpath = self.fs.get_path(fname)
-        self.word.save(fpath)
+        args = self.prepare_word_cv(person, job)
+        fpath = build_word_cv(self.get_papers, *args)
         log(f'Document "{fpath}" is saved', 'res')
 
-    def export_grant_papers(self):
-        if len(self.task.get('grants', [])) != 1:
-            text = 'export_grant_papers (task should contain only one grant)'
-            log(text, 'err')
+    def export_word_cvs(self, jobs):
+        """Export CVs for the given jobs (team members) maybe in parallel.
+
+        Note:
+            The logo and photos of all team members are downloaded first by
+            concurrent requests (see "FS.download_photos"). If the number of
+            workers is greater than 1, then the documents are built in the
+            pool of processes. The statistics are computed in the main
+            process, and each worker receives the prepared index of papers
+            (and journals) only once at the start. Errors of all workers are
+            collected and logged after all the documents are processed (see
+            also "run_job"). If the photo of the team member (or the logo)
+            is not downloaded, then only the CVs which need it are failed.
+
+        """
+        uids = [job['uid'] for job in jobs]
+
+        with span('download_photos') as sp:
+            fetched = self.fs.fetched
+            persons = [(uid[1:], self.team[uid].get('photo')) for uid in uids
+                if uid in self.team]
+            errors = self.fs.download_photos(persons)
+            sp.count = self.fs.fetched - fetched
+
+        jobs_failed = []
+        for job in jobs:
+            e = errors.get(None) or errors.get(job['uid'][1:])
+            if e is not None:
+                jobs_failed.append(job)
+                self.add_error(job, e)
+        if len(jobs_failed) and self.is_strict:
+            text = ', '.join(job['uid'] for job in jobs_failed)
+            log(f'export_word_cvs (failed photos for {text})', 'err')
+        jobs = [job for job in jobs if not job in jobs_failed]
+
+        if self.workers <= 1:
+            for job in jobs:
+                self.run_job(job)
             return
 
-        grant = self.grants.get(self.task['grants'][0])
+        def prepare(job):
+            person = self.team.get(job['uid'])
+            if person is None:
+                uid = job['uid']
+                text = f'export_word_cvs (invalid team member uid "{uid}")'
+                log(text, 'err')
+            return job, self.prepare_word_cv(person, job)
+
+        tasks = [self.run_job(job, prepare) for job in jobs]
+        tasks = [task for task in tasks if task is not None]
+
+        errors = []
+        with ProcessPoolExecutor(self.workers, initializer=init_worker,
+                                 initargs=(self.papers,)) as executor:
+            futures = [executor.submit(run_worker_cv, *t) for _, t in tasks]
+            for (job, _), future in zip(tasks, futures):
+                try:
+                    fpath, item, error = future.result()
+                    PROFILE.append(item)
+                except Exception as e: # The worker is broken
+                    fpath, error = None, e
+                if error is None:
+                    log(f'Document "{fpath}" is saved', 'res')
+                else:
+                    errors.append(job['uid'])
+                    self.add_error(job, error)
+
+        if len(errors) and self.is_strict:
+            log(f'export_word_cvs (failed for {", ".join(errors)})', 'err')
+
+    def export_grant_papers(self, job):
+        grant = self.grants.get(job['uid'])
         if grant is None:
             text = 'export_grant_papers (invalid grant uid in task)'
             log(text, 'err')
             return
 
         uid = grant['id']
-        stat = self.get_papers_stat(years=YEARS, grant=uid)
+        years = job['years']
+        stat = self.get_papers_stat(years=years, grant=uid)
         photo_logo = self.fs.download_photo_logo()
 
         head = grant.get('head', '')
         head = self.team[head]
 
-        self.word = Word(YEARS, self.get_papers)
+        from word import Word
+
+        self.word = Word(years, self.get_papers, photo_logo)
         self.word.add_grant_info(grant, head, photo_logo)
         self.word.add_note(is_grant=True)
         self.word.add_break()
-        self.word.add_paper_list(stat, grant=uid, with_links=True)
+        self.word.add_paper_list(stat, grant=uid, with_links=True,
+            quartiles=job['quartiles'])
 
-        fname = 'CAIT_' + uid[1:] + '.docx'
-        fpath = self.fs.get_path(fname)
+        fpath = self.fs.get_path(self.tasks.get_fname(job))
         self.word.save(fpath)
         log(f'Document "{fpath}" is saved', 'res')
 
-    def export_stat(self):
+    def export_stat(self, job):
+        import matplotlib.pyplot as plt
+
+        for uid in job['authors']:
+            if not uid in self.team:
+                log(f'export_stat (invalid team member uid "{uid}" in task)',
+                    'err')
+
+        years = job['years']
         stats = {}
-        for uid in self.team.keys():
-            if self.team[uid].get('active') != 'Yes':
-                continue
-            if self.team[uid].get('lead') != 'Yes':
-                continue
-            stats[uid] = self.get_papers_stat(uid, YEARS)
+        for uid in job['authors']:
+            stats[uid] = self.get_papers_stat(uid, years)
 
+        fig = plt.figure()
         for uid, stat in stats.items():
-            x = YEARS
-            y = [stat[y]['total'] for y in YEARS]
+            x = years
+            y = [sum(stat[y][f'q{q}'] for q in job['quartiles'])
+                for y in years]
             plt.plot(x, y, marker='o', label=uid)
 
         plt.legend(loc='best')
 
-        fpath = self.fs.get_path('plot.png')
+        fpath = self.fs.get_path(self.tasks.get_fname(job))
         plt.savefig(fpath)
+        plt.close(fig)
         log(f'Figure "{fpath}" is saved', 'res')
 
+    def get_job_count(self, job):
+        """Return the number of items (papers or authors) for the profile."""
+        if job['kind'] == 'cv':
+            return self.get_papers_stat(job['uid'], job['years'])['total'][
+                'total']
+        if job['kind'] == 'grant':
+            return self.get_papers_stat(years=job['years'], grant=job['uid'])[
+                'total']['total']
+        return len(job['authors'])
+
     def get_papers(self, author=None, year=None, q=None, grant=None):
-        res = {}
+        key = ('papers', author, year, q, grant)
+        if not key in self.cache:
+            self.cache[key] = self.papers.find(author, year, q, grant)
+        return self.cache[key]
 
-        for title, paper in self.papers.items():
-            if year and int(year) != int(paper['year']):
-                continue
+    def get_papers_stat(self, author=None, years=[], grant=None):
+        key = ('stat', author, tuple(years), grant)
+        if not key in self.cache:
+            self.cache[key] = self.papers.stat(author, years, grant)
+        return self.cache[key]
+
+    def load_data(self, names=TABLES):
+        """Load the given tables from the excel file or the columnar store.
+
+        Note:
+            If the folder "STORE_FOLDER" with the parquet files of all tables
+            is present in the working folder (see "save_store" and the flag
+            "-p" of the script), and it is newer than the excel file (or the
+            excel file is absent), then the tables are loaded from the store.
+
+            The tables are returned together with the key of the source files
+            (see "load_book_cached" and "hash_store"), e.g., for the database.
+            The key does not depend on the given tables, and the subsets of
+            tables are cached in the separate files.
+
+        """
+        fpath = self.fs.get_path('cait.xlsx')
+        folder = self.fs.get_path(STORE_FOLDER)
+
+        if is_store(folder, TABLES):
+            if not os.path.isfile(fpath) or \
+                    os.path.getmtime(fpath) <= get_store_mtime(folder, TABLES):
+                return load_store(folder, names), hash_store(folder, TABLES)
+
+        fname = 'cait' if names == TABLES else 'cait_' + '_'.join(names)
+        return load_book_cached(fpath, names,
+            self.fs.get_path(f'tmp/{fname}.pkl'))
+
+    def log_stat(self, uid=None, years=YEARS):
+        """Print the numbers of papers for the team member or the grant."""
+        if uid is None or uid in self.team:
+            stat = self.get_papers_stat(uid, years)
+        elif uid in self.grants:
+            stat = self.get_papers_stat(years=years, grant=uid)
+        else:
+            log(f'Invalid team member or grant uid "{uid}"', 'err')
+
+        text = '\n' + '=' * 60 + ' '
+        text += f'Papers of "{uid or "all"}" ({years[0]}-{years[-1]})' + '\n'
+        text += '>>> Year    :     Q1     Q2  Other  Total\n'
+        for year in list(years) + ['total']:
+            v = stat[year]
+            text += f'>>> {str(year).title():<8}: {v["q1"]:6d} {v["q2"]:6d} '
+            text += f'{v["q0"]:6d} {v["total"]:6d}\n'
+        text += '-' * 60 + '\n'
+
+        print(text)
+
+    def load_errors(self):
+        """Replace the planned jobs by the failed jobs of the previous run.
+
+        Note:
+            The jobs are loaded from the file ERRORS_FILE (see "save_errors")
+            and they are added to the plan by "Tasks.add", hence they are
+            validated and deduplicated as the jobs from the specs.
+
+        """
+        fpath = self.fs.get_path(ERRORS_FILE)
+        if not os.path.isfile(fpath):
+            log(f'There are no failed reports to retry ("{fpath}")', 'err')
+        with open(fpath, 'r') as f:
+            errors = json.load(f)
+
+        self.tasks.jobs = []
+        for error in errors:
+            job = error['job']
+            self.tasks.add(job.get('kind'), job.get('uid'),
+                job.get('authors') or [], job.get('years'),
+                job.get('quartiles'), job.get('format'), job.get('spec'))
+        count = len(self.tasks.jobs)
+        log(f'The {count} failed reports will be retried', 'res')
+
+    def prepare_word_cv(self, person, job):
+        uid = person['id']
+        stat = self.get_papers_stat(uid, job['years'])
+        photo_logo = self.fs.download_photo_logo()
+        photo_person = self.fs.download_photo(uid[1:], person.get('photo'))
+        fpath = self.fs.get_path(self.tasks.get_fname(job))
+        return (person, stat, photo_person, photo_logo, fpath, job['years'],
+            job['quartiles'])
+
+    def run_tasks(self):
+        """Build all reports from the plan (see "Tasks") as one batch.
+
+        Note:
+            The cubes of statistics are built once for each distinct set of
+            years of the plan, and the results of all requests of papers and
+            statistics are cached (see "get_papers" and "get_papers_stat"),
+            hence the requests shared by different reports are computed only
+            once. The CVs are built together (maybe in parallel), and then
+            other reports are built in the order of the plan. The time and
+            memory of all stages are saved into the file "profile.json" in
+            the export folder (see "span" and "save_profile").
+
+        """
+        self.cache = {}
+
+        if hasattr(self.papers, 'build_cube'):
+            for years in self.tasks.get_years():
+                self.papers.build_cube(years)
+
+        self.errors = []
+
+        jobs = self.tasks.jobs
+        jobs_cv = [job for job in jobs if job['kind'] == 'cv']
+        if len(jobs_cv):
+            with span('export_word_cvs', workers=self.workers) as sp:
+                self.export_word_cvs(jobs_cv)
+                sp.count = len(jobs_cv)
+
+        for job in jobs:
+            if job['kind'] != 'cv':
+                self.run_job(job)
+
+        self.save_errors(len(jobs))
+        save_profile(self.fs.get_path('profile.json'))
+
+    def run_job(self, job, func=None):
+        """Run the job in isolation from other jobs of the batch.
+
+        Note:
+            If the flag "is_strict" is not set, then the errors of the job
+            (including the errors logged by "log", see "collect") are caught
+            and collected in the list "errors", and the batch is continued
+            with the next job. The failed jobs are then saved into the file
+            ERRORS_FILE (see "save_errors"), and only they may be retried
+            by the next run (see the flag "-r" of the "export" command).
+
+        """
+        func = func or self.export_job
+        if self.is_strict:
+            return func(job)
+
+        try:
+            with collect():
+                return func(job)
+        except Exception as e:
+            self.add_error(job, e)
+
+    def save_errors(self, count):
+        """Save the failed jobs into the file for the retry and log them."""
+        fpath = self.fs.get_path(ERRORS_FILE)
+
+        if len(self.errors) == 0:
+            if os.path.isfile(fpath):
+                os.remove(fpath)
+            log(f'All {count} reports are built', 'res')
+            return
 
-            if author and not author in paper['authors_parsed']:
-                continue
+        with open(fpath + '.tmp', 'w') as f:
+            json.dump(self.errors, f, indent=4)
+        os.replace(fpath + '.tmp', fpath)
 
-            if grant and not grant in paper.get('grant', ''):
-                continue
+        text = f'The {len(self.errors)} of {count} reports are failed: '
+        text += ', '.join(get_job_name(error['job'], YEARS)
+            for error in self.errors)
+        text += f' (see "{fpath}", use "export -r" to retry them)'
+        log(text, 'wrn')
 
-            if q is not None:
-                journal = self.journals.data[paper['journal']]
-                q1 = journal.get('sjr_q1', '')
-                q2 = journal.get('sjr_q2', '')
-                if q == 1 and len(q1) < 2:
-                    continue
-                if q == 2 and (len(q1) >= 2 or len(q2) < 2):
-                    continue
-                if q == 0 and (len(q1) >= 2 or len(q2) >= 2):
-                    continue
 
-            res[title] = paper
-            res[title]['journal_object'] = self.journals.data[paper['journal']]
+def build_word_cv(get_papers, person, stat, photo_person, photo_logo, fpath,
+                  years=YEARS, quartiles=TASK_QUARTILES):
+    from word import Word
 
-        return res
+    word = Word(years, get_papers, photo_logo)
+    word.add_person_info(person, photo_person, photo_logo)
+    word.add_person_stat(stat)
+    word.add_note(is_grant=True)
+    word.add_break()
+    word.add_paper_list(stat, author=person['id'], quartiles=quartiles)
+    word.save(fpath)
+    return fpath
 
-    def get_papers_stat(self, author=None, years=[], grant=None):
-        res = {}
-
-        for year in years:
-            res[year] = {
-                'q1': len(self.get_papers(author, year, q=1, grant=grant)),
-                'q2': len(self.get_papers(author, year, q=2, grant=grant)),
-                'q0': len(self.get_papers(author, year, q=0, grant=grant)),
-                'total': len(self.get_papers(author, year, grant=grant))
-            }
-        res['total'] = {
-            'q1': sum(res[year]['q1'] for year in years),
-            'q2': sum(res[year]['q2'] for year in years),
-            'q0': sum(res[year]['q0'] for year in years),
-            'total': sum(res[year]['total'] for year in years),
-        }
-        return res
 
+def get_option(args, name, default=None):
+    """Remove the option "name VALUE" from the list of args."""
+    if not name in args:
+        return default
+    i = args.index(name)
+    if i + 1 >= len(args):
+        raise ValueError(f'Invalid arguments for script (no value of {name})')
+    value = args[i + 1]
+    del args[i:i+2]
+    return value
 
-if __name__ == '__main__':
-    args = sys.argv[1:]
+
+def get_flag(args, name):
+    """Remove the flag "name" from the list of args."""
+    if not name in args:
+        return False
+    args.remove(name)
+    return True
+
+
+def init_worker(papers):
+    WORKER['papers'] = papers
+
+
+def parse_args(args):
+    """Return the subcommand and its arguments for the script.
+
+    Note:
+        The old flags of the script are supported as aliases, i.e., "-f" is
+        the same as "folder", "-w N" and "-d" are the same as "export -w N"
+        and "export -d", "-j TITLE" is the same as "journal TITLE" and "-p"
+        is the same as "store". Without arguments the "export" is run.
+
+    """
+    args = list(args)
     if len(args) == 0:
-        ibm = InBiMa()
-    elif len(args) == 1 and args[0] == '-f':
-        ibm = InBiMa(is_new_folder=True)
-    elif len(args) == 2 and args[0] == '-j':
-        journals = Journals()
-        journals.load_ref()
-        journals.log_ref(title=args[1])
-    else:
-        raise ValueError('Invalid arguments for script')
+        return 'export', []
+    if args[0] in COMMAND_FLAGS:
+        command = COMMAND_FLAGS[args[0]]
+        return command[0], command[1:] + args[1:]
+    if args[0] in COMMANDS:
+        return args[0], args[1:]
+    raise ValueError('Invalid arguments for script')
+
+
+def run_command(command, args=[]):
+    """Run the subcommand of the script.
+
+    Note:
+        Each subcommand imports only the modules it needs (e.g., "folder"
+        and "journal" do not load matplotlib and python-docx, which are
+        used only for "export"), hence the light commands start fast. The
+        import time of subcommands may be checked by the command
+        "python -m bench.bench_importtime".
+
+    """
+    args = list(args)
+
+    if command == 'export':
+        workers = int(get_option(args, '-w', WORKERS))
+        with_db = get_flag(args, '-d')
+        is_retry = get_flag(args, '-r')
+        is_strict = get_flag(args, '-s')
+        if len(args) == 0:
+            return InBiMa(workers=workers, with_db=with_db,
+                is_retry=is_retry, is_strict=is_strict)
+
+    elif command == 'folder':
+        if len(args) == 0:
+            return FS(is_new_folder=True)
+
+    elif command == 'journal':
+        if len(args) == 1:
+            journals = Journals()
+            journals.load_ref()
+            return journals.log_ref(title=args[0])
+
+    elif command == 'parse-wos':
+        from parser_wos import run_cli
+        return run_cli(args)
+
+    elif command == 'stats':
+        with_db = get_flag(args, '-d')
+        if len(args) <= 1:
+            ibm = InBiMa(with_db=with_db, with_tasks=False)
+            return ibm.log_stat(args[0] if len(args) else None)
+
+    elif command == 'store':
+        if len(args) == 0:
+            fs = FS()
+            data, _ = load_book_cached(fs.get_path('cait.xlsx'), TABLES,
+                fs.get_path('tmp/cait.pkl'))
+            return save_store(fs.get_path(STORE_FOLDER), data)
+
+    raise ValueError(f'Invalid arguments for command "{command}"')
+
+
+def run_worker_cv(*args):
+    """Build the CV in the worker process (see "export_word_cvs").
+
+    Returns:
+        tuple: the path to the document (None if it is failed), the item of
+        the profile (see "Span.close") and the error (None if it is built).
+
+    """
+    sp = Span('export_word_cv', uid=args[0]['id'])
+    fpath, error = None, None
+    try:
+        with sp:
+            fpath = build_word_cv(WORKER['papers'].find, *args)
+        sp.count = args[1]['total']['total']
+    except Exception as e:
+        error = e
+    finally:
+        item = sp.close()
+    return fpath, item, error
+
+
+if __name__ == '__main__':
+    run_command(*parse_args(sys.argv[1:]))
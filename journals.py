@@ -1,31 +1,138 @@
+import bisect
 import csv
-from Levenshtein import distance
-import openpyxl
+import os
+import re
+import sqlite3
 
 
-from utils import load_sheet
+from utils import load_book
 from utils import log
 
 
-REF_SCO_PATH = './journals/CiteScore.xlsx'
+REF_SCO_PATH = './journals/CiteScore {year}.xlsx'
 REF_SCO_SHEET = 'DATA'
-REF_SCO_INDEX_NAME = 'CiteScore 2020'
-REF_SJR_PATH = './journals/scimagojr 2020.csv'
+REF_SCO_INDEX_NAME = 'CiteScore {year}'
+REF_SJR_PATH = './journals/scimagojr {year}.csv'
+REF_DB_PATH = './journals/ref.db'
+REF_DB_VERSION = 2
+REF_DB_SJR_LISTS = ['sjr_q1', 'sjr_q2', 'sjr_q3', 'sjr_q4', 'sjr_q0']
+REF_DB_SJR_COLUMNS = ['pos', 'sjr_year', 'title', 'title_lower', 'title_norm',
+    'sjr_rank', 'sjr_type', 'issn', 'issn_all', 'sjr_index', 'sjr_h_index',
+    'country', 'publisher', 'sjr_q_raw'] + REF_DB_SJR_LISTS
+REF_DB_SCO_COLUMNS = ['sco_year', 'title', 'sco_index', 'sco_sjr_index',
+    'sco_area']
 
 
 class Journals():
     def __init__(self, data={}):
         self.data = data
+        self.title_index = {}
+        self.q = {}
+        self.ref_db = None
+        self.ref_years = []
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['ref_db'] = None # The connection to database can not be pickled
+        state['title_index'] = {}
+        return state
+
+    def compile_ref(self):
+        """Compile the reference info on journals into the SQLite file.
+
+        Note:
+            The csv files of Scimago Journal Rank (and excel files of Scopus
+            CiteScore if they exist) for all available years are parsed
+            once and saved into the SQLite database REF_DB_PATH (one table
+            indexed by the journal and the year) with typed columns and with
+            the categories of journals already split by quartiles. The sizes
+            and modification times of the source files are saved too, so
+            the database is recompiled only if the sources are changed.
+
+        """
+        if os.path.isfile(REF_DB_PATH):
+            os.remove(REF_DB_PATH)
+
+        db = sqlite3.connect(REF_DB_PATH)
+        with db:
+            db.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+            db.execute(f'CREATE TABLE sjr ({", ".join(REF_DB_SJR_COLUMNS)})')
+            db.execute('CREATE TABLE sjr_issn (issn TEXT, sjr_year INTEGER, '
+                'pos INTEGER)')
+            db.execute('CREATE TABLE sjr_quartile (name TEXT)')
+            db.execute(f'CREATE TABLE sco ({", ".join(REF_DB_SCO_COLUMNS)})')
+
+            db.executemany('INSERT INTO meta VALUES (?, ?)',
+                self.get_ref_db_meta().items())
+
+            pos = 0
+            quartiles = {}
+            for year in find_ref_years(REF_SJR_PATH):
+                self.load_ref_sjr(year)
+                quartiles.update(dict.fromkeys(self.ref_sjr_quartiles))
+
+                rows = []
+                rows_issn = []
+                for item in self.ref_sjr.values():
+                    row = dict(item, pos=pos,
+                        title_lower=item['title'].lower(),
+                        title_norm=normalize_title(item['title']))
+                    row['issn_all'] = ', '.join(item['issn_all'])
+                    for name in REF_DB_SJR_LISTS:
+                        row[name] = '; '.join(item[name])
+                    rows.append([row[name] for name in REF_DB_SJR_COLUMNS])
+                    for issn in item['issn_all']:
+                        if issn:
+                            rows_issn.append([normalize_issn(issn), year, pos])
+                    pos += 1
+
+                marks = ', '.join(['?'] * len(REF_DB_SJR_COLUMNS))
+                db.executemany(f'INSERT INTO sjr VALUES ({marks})', rows)
+                db.executemany('INSERT INTO sjr_issn VALUES (?, ?, ?)',
+                    rows_issn)
+
+            db.executemany('INSERT INTO sjr_quartile VALUES (?)',
+                [[name] for name in quartiles])
+
+            for year in find_ref_years(REF_SCO_PATH):
+                self.load_ref_sco(year)
+                marks = ', '.join(['?'] * len(REF_DB_SCO_COLUMNS))
+                db.executemany(f'INSERT INTO sco VALUES ({marks})',
+                    [[item[name] for name in REF_DB_SCO_COLUMNS]
+                        for item in self.ref_sco.values()])
+
+            db.execute('CREATE INDEX sjr_title_lower ON sjr '
+                '(sjr_year, title_lower)')
+            db.execute('CREATE INDEX sjr_title_norm ON sjr '
+                '(sjr_year, title_norm)')
+            db.execute('CREATE INDEX sjr_issn_issn ON sjr_issn '
+                '(issn, sjr_year)')
+        db.close()
+
+        log(f'Journals info is compiled into "{REF_DB_PATH}"', 'res')
 
     def find(self, title, journals=None):
+        return self.find_many([title], journals)[0]
+
+    def find_many(self, titles, journals=None):
+        """Find journals by titles (the list of 10 most similar on a miss).
+
+        Note:
+            The index of the journal titles is built on the first call for
+            the given dict of journals and then it is reused for all the
+            following calls (see "TitleIndex").
+
+        """
         journals = journals or self.data
 
-        res = []
-        for journal in journals.values():
-            dist = distance((title or '').lower(), journal['title'].lower())
-            res.append([journal, dist])
-        res.sort(key=lambda x: x[1])
+        key = id(journals)
+        if not key in self.title_index:
+            self.title_index[key] = (journals, TitleIndex(journals.values()))
+        index = self.title_index[key][1]
+
+        return [self.find_result(index.search(t)) for t in titles]
 
+    def find_result(self, res):
         if len(res) == 0:
             return None, []
 
@@ -33,7 +140,7 @@ class Journals():
             if res[0][1] == 0:
                 return res[0][0], []
             else:
-                return None, [res[0]['title']]
+                return None, [res[0][0]['title']]
 
         if res[0][1] == 0 and res[1][1] != 0:
             return res[0][0], []
@@ -42,18 +149,39 @@ class Journals():
         return None, titles
 
     def get_journal(self, title=None, issn=None, dist_max=0, dist_max_wrn=1):
+        from Levenshtein import distance
+
         if not issn and (not title or len(title) < 2):
             return
 
-        for title_real, item in self.journals_ref.items():
-            t = title_real.lower()
-            if issn and issn == item['issn']:
+        if issn:
+            item = self.get_ref_sjr_by('issn', normalize_issn(issn))
+            if item:
+                t = item['title'].lower()
                 if title and distance(title.lower(), t) > dist_max:
                     text = 'Journal found by ISSN but titles are different: '
-                    text += f'"{title}" is replaced by "{title_real}"'
+                    text += f'"{title}" is replaced by "{item["title"]}"'
                     log(text, 'wrn')
                 return item
-            dist = distance(title.lower(), t)
+
+        if not title or len(title) < 2:
+            return
+
+        item = self.get_ref_sjr_by('title_lower', title.lower())
+        if item:
+            return item
+
+        item = self.get_ref_sjr_by('title_norm', normalize_title(title))
+        if item:
+            text = f'Journal "{title}" is replaced by "{item["title"]}"'
+            log(text, 'wrn')
+            return item
+
+        if dist_max <= 0:
+            return
+
+        for title_real, item in self.get_ref_sjr().items():
+            dist = distance(title.lower(), title_real.lower())
             if dist > dist_max:
                 continue
             if dist >= dist_max_wrn:
@@ -61,37 +189,182 @@ class Journals():
                 log(text, 'wrn')
             return item
 
+    def get_ref_db_meta(self):
+        meta = {'version': str(REF_DB_VERSION)}
+        for name, path in [('sjr', REF_SJR_PATH), ('sco', REF_SCO_PATH)]:
+            for year in find_ref_years(path):
+                st = os.stat(path.format(year=year))
+                meta[f'{name} {year}'] = f'{st.st_size}:{st.st_mtime_ns}'
+        return meta
+
+    def get_q(self, title, year):
+        """Return the quartile class (1, 2 or 0) of the journal for the year.
+
+        Note:
+            If the reference info is loaded (see "load_ref"), then the SJR
+            snapshot for the given year (or for the nearest previous year,
+            or for the first available year) is used. If the journal is not
+            found in the snapshot, then the values "sjr_q1" and "sjr_q2" of
+            the journal from the journals sheet are used. The result is
+            cached for each pair (journal, snapshot year).
+
+        """
+        key = (title, self.get_ref_year(year))
+        if not key in self.q:
+            self.q[key] = self.get_q_real(title, key[1])
+        return self.q[key]
+
+    def get_q_real(self, title, year=None):
+        journal = self.data.get(title, {})
+
+        item = None
+        if self.ref_db is not None and year is not None:
+            issn = str(journal.get('issn', ''))
+            if issn:
+                item = self.get_ref_sjr_by('issn', normalize_issn(issn), year)
+            if not item:
+                item = self.get_ref_sjr_by('title_lower', title.lower(), year)
+            if not item:
+                value = normalize_title(title)
+                item = self.get_ref_sjr_by('title_norm', value, year)
+
+        if item:
+            is_q1 = len(item['sjr_q1']) > 0
+            is_q2 = len(item['sjr_q2']) > 0
+        else:
+            is_q1 = len(journal.get('sjr_q1', '')) >= 2
+            is_q2 = len(journal.get('sjr_q2', '')) >= 2
+
+        if is_q1:
+            return 1
+        if is_q2:
+            return 2
+        return 0
+
+    def get_ref_year(self, year):
+        """Return the year of the SJR snapshot to use for the given year."""
+        if len(self.ref_years) == 0:
+            return
+        i = bisect.bisect_right(self.ref_years, int(year))
+        return self.ref_years[max(i - 1, 0)]
+
+    def get_ref_sco(self):
+        """Return the dict of all Scopus journals (the last year of each)."""
+        if self.ref_sco is None:
+            self.ref_sco = {}
+            names = ', '.join(REF_DB_SCO_COLUMNS)
+            query = f'SELECT {names} FROM sco ORDER BY sco_year'
+            for row in self.ref_db.execute(query):
+                item = dict(zip(REF_DB_SCO_COLUMNS, row))
+                self.ref_sco[item['title']] = item
+        return self.ref_sco
+
+    def get_ref_sjr(self):
+        """Return the dict of all SJR journals for the last available year."""
+        if self.ref_sjr is None:
+            self.ref_sjr = {}
+            names = ', '.join(REF_DB_SJR_COLUMNS)
+            query = f'SELECT {names} FROM sjr WHERE sjr_year = ? ORDER BY pos'
+            for row in self.ref_db.execute(query, [self.ref_year]):
+                item = self.parse_ref_sjr_row(row)
+                self.ref_sjr[item['title']] = item
+        return self.ref_sjr
+
+    def get_ref_sjr_by(self, name, value, year=None):
+        """Find the SJR journal by the indexed column of the database.
+
+        Args:
+            name (str): the name of the column ('issn', 'title_lower' or
+                'title_norm'; see "normalize_issn" and "normalize_title").
+            value (str): the value of the column.
+            year (int): the year of the SJR snapshot (if it is not set, then
+                the last available year is used).
+
+        Returns:
+            dict: the journal (or None if it is not found). If several
+            journals have the same value, then the first one is returned.
+
+        """
+        names = ', '.join(REF_DB_SJR_COLUMNS)
+        if name == 'issn':
+            query = f'SELECT {names} FROM sjr WHERE pos = '
+            query += '(SELECT MIN(pos) FROM sjr_issn '
+            query += 'WHERE issn = ? AND sjr_year = ?)'
+        else:
+            query = f'SELECT {names} FROM sjr '
+            query += f'WHERE {name} = ? AND sjr_year = ? '
+            query += 'ORDER BY pos LIMIT 1'
+        year = self.ref_year if year is None else year
+        row = self.ref_db.execute(query, [value, year]).fetchone()
+        return self.parse_ref_sjr_row(row) if row else None
+
+    def is_ref_db_actual(self):
+        if not os.path.isfile(REF_DB_PATH):
+            return False
+        db = sqlite3.connect(REF_DB_PATH)
+        try:
+            meta = dict(db.execute('SELECT key, value FROM meta'))
+        except sqlite3.DatabaseError:
+            meta = {}
+        finally:
+            db.close()
+        return meta == self.get_ref_db_meta()
+
     def load_ref(self):
-        self.load_ref_sjr()
-        # self.load_ref_sco()
-        # for j in self.ref_sjr.values():
-        #    self.print_ref_sjr(j)
-        # print(self.ref_sjr_quartiles)
+        """Open the compiled reference info on journals (see "compile_ref").
+
+        Note:
+            Only the connection to the database is opened here, and the
+            journals are then queried on demand by indexed columns (see
+            "get_ref_sjr_by"). The full dict of journals for the last year
+            is loaded on the first call of "get_ref_sjr" (and the Scopus info
+            on the first call of "get_ref_sco"), hence the single query, like
+            "python inbima.py -j TITLE", does not load the full tables.
+
+        """
+        if not self.is_ref_db_actual():
+            self.compile_ref()
 
-    def load_ref_sco(self):
-        """Load Scopus journals info from excel file.
+        self.ref_db = sqlite3.connect(REF_DB_PATH)
+        self.ref_sjr = None
+        self.ref_sjr_items = {}
+        self.ref_sco = None
+        self.q = {}
+
+        res = self.ref_db.execute('SELECT DISTINCT sjr_year FROM sjr')
+        self.ref_years = sorted(row[0] for row in res)
+        self.ref_year = self.ref_years[-1] if len(self.ref_years) else None
+
+        res = self.ref_db.execute('SELECT name FROM sjr_quartile ORDER BY rowid')
+        self.ref_sjr_quartiles = [row[0] for row in res]
+
+    def load_ref_sco(self, year):
+        """Load Scopus journals info from excel file for the given year.
 
         Note:
             See for data https://www.scopus.com/sources.
 
             We are interested in the following fields of the excel file:
                 Col. 01 Title -> 'title' (it will be the key for dict);
-                Col. 02 CiteScore 2020 -> 'sco_index'
+                Col. 02 CiteScore YEAR -> 'sco_index'
         """
         self.ref_sco = {}
 
-        wb = openpyxl.load_workbook(REF_SCO_PATH)
-        data = load_sheet(wb[REF_SCO_SHEET])
+        fpath = REF_SCO_PATH.format(year=year)
+        data = load_book(fpath, [REF_SCO_SHEET])[REF_SCO_SHEET]
+        index_name = REF_SCO_INDEX_NAME.format(year=year)
+        index_name = index_name.lower().replace(' ', '_')
         for row in data.values():
             self.ref_sco[row['title']] = {
+                'sco_year': year,
                 'title': row['title'],
-                'sco_index': row[REF_SCO_INDEX_NAME],
-                'sco_sjr_index': row['sjr'],
-                'sco_area': row['Scopus Sub-Subject Area'],
+                'sco_index': row.get(index_name),
+                'sco_sjr_index': row.get('sjr'),
+                'sco_area': row.get('scopus_sub-subject_area'),
             }
 
-    def load_ref_sjr(self):
-        """Load Scimago Journal Rank from the csv file.
+    def load_ref_sjr(self, year):
+        """Load Scimago Journal Rank from the csv file for the given year.
 
         Note:
             See for data https://www.scimagojr.com/journalrank.php.
@@ -102,7 +375,7 @@ class Journals():
                 No. 00 Rank       -> 'sjr_rank';
                 No. 02 Title      -> 'title' (it will be the key for dict);
                 No. 03 Type       -> 'sjr_type'
-                No. 04 Issn       -> 'issn' (only print ISSN saved);
+                No. 04 Issn       -> 'issn' (last ISSN), 'issn_all';
                 No. 05 SJR        -> 'sjr_index';
                 No. 06 SJR Best Quartile
                 No. 07 H index    -> 'sjr_h_index';
@@ -112,54 +385,68 @@ class Journals():
 
         """
         self.ref_sjr = {}
-        self.ref_sjr_quartiles = []
+        quartiles = {}
 
         def parse_issn(issn):
             if not issn or len(issn) < 8:
                 return ''
             return issn[-8:-4] + '-' + issn[-4:]
 
-        def parse_quartiles(data, kind):
-            res = []
-            for item in data.split('; '):
-                if item.endswith('(Q1)'):
-                    if kind == 'Q1': res.append(item[:-5])
-                elif item.endswith('(Q2)'):
-                    if kind == 'Q2': res.append(item[:-5])
-                elif item.endswith('(Q3)'):
-                    if kind == 'Q3': res.append(item[:-5])
-                elif item.endswith('(Q4)'):
-                    if kind == 'Q4': res.append(item[:-5])
-                else:
-                    if kind == 'Q0': res.append(item)
+        def parse_issn_all(issn):
+            return [parse_issn(v.strip()) for v in issn.split(',')]
 
-            for name in res:
-                if not name in self.ref_sjr_quartiles:
-                    self.ref_sjr_quartiles.append(name)
+        def parse_number(value, kind=float):
+            try:
+                return kind(value.replace(',', '.'))
+            except ValueError:
+                return 0
 
+        def parse_quartiles(data):
+            res = {'Q1': [], 'Q2': [], 'Q3': [], 'Q4': [], 'Q0': []}
+            for item in data.split('; '):
+                if not item:
+                    continue
+                kind = item[-3:-1]
+                if item[-4:-3] == '(' and item[-1:] == ')' and kind != 'Q0':
+                    name = item[:-5]
+                else:
+                    kind, name = 'Q0', item
+                res[kind].append(name)
+                quartiles[name] = True
             return res
 
-        with open(REF_SJR_PATH, newline='') as f:
-            for row in [r for r in csv.reader(f, delimiter=';')][1:]:
+        with open(REF_SJR_PATH.format(year=year), newline='') as f:
+            reader = csv.reader(f, delimiter=';')
+            next(reader, None)
+            for row in reader:
+                q = parse_quartiles(row[19])
                 self.ref_sjr[row[2]] = {
-                    'sjr_rank': row[0],
+                    'sjr_year': year,
+                    'sjr_rank': parse_number(row[0], int),
                     'title': row[2],
                     'sjr_type': row[3],
                     'issn': parse_issn(row[4]),
-                    'sjr_index': row[5] or 0,
-                    'sjr_h_index': row[7],
+                    'issn_all': parse_issn_all(row[4]),
+                    'sjr_index': parse_number(row[5]),
+                    'sjr_h_index': parse_number(row[7], int),
                     'country': row[15],
                     'publisher': row[17],
                     'sjr_q_raw': row[19],
-                    'sjr_q1': parse_quartiles(row[19], 'Q1'),
-                    'sjr_q2': parse_quartiles(row[19], 'Q2'),
-                    'sjr_q3': parse_quartiles(row[19], 'Q3'),
-                    'sjr_q4': parse_quartiles(row[19], 'Q4'),
-                    'sjr_q0': parse_quartiles(row[19], 'Q0'),
+                    'sjr_q1': q['Q1'],
+                    'sjr_q2': q['Q2'],
+                    'sjr_q3': q['Q3'],
+                    'sjr_q4': q['Q4'],
+                    'sjr_q0': q['Q0'],
                 }
 
+        self.ref_sjr_quartiles = list(quartiles.keys())
+
     def log_ref(self, title):
-        journal, titles = self.find(title, self.ref_sjr)
+        journal = self.get_ref_sjr_by('title_lower', (title or '').lower())
+        if journal:
+            return self.log_ref_sjr(journal)
+
+        journal, titles = self.find(title, self.get_ref_sjr())
 
         if journal:
             self.log_ref_sjr(journal)
@@ -176,7 +463,7 @@ class Journals():
 
     def log_ref_sjr(self, journal):
         text = '\n' + '=' * 60 + ' '
-        text += 'SJR journal info' + '\n'
+        text += f'SJR journal info ({journal["sjr_year"]})' + '\n'
 
         v = journal['issn'] or ' '*9
         text += f'[{v}] '
@@ -208,3 +495,122 @@ class Journals():
         text += '-' * 60 + '\n'
 
         print(text)
+
+    def parse_ref_sjr_row(self, row):
+        pos = row[0]
+        if not pos in self.ref_sjr_items:
+            item = dict(zip(REF_DB_SJR_COLUMNS, row))
+            del item['pos']
+            del item['title_lower']
+            del item['title_norm']
+            item['issn_all'] = item['issn_all'].split(', ')
+            for name in REF_DB_SJR_LISTS:
+                item[name] = item[name].split('; ') if item[name] else []
+            self.ref_sjr_items[pos] = item
+        return self.ref_sjr_items[pos]
+
+
+class TitleIndex():
+    """Index of journal titles for the approximate search.
+
+    Note:
+        Each title is split into the character n-grams (trigrams of the
+        title in lower case padded by spaces) and the inverted index
+        n-gram -> positions of titles is built. For the query the titles are
+        compared by the edit distance (by chunks), and the top "count" of
+        them are kept. Since one edit changes at most n n-grams, the edit
+        distance of the title with the score s (the number of common
+        n-grams) is at least (|grams(query)| - s) / n, and it is at least
+        the difference of the lengths. The titles are compared in the order
+        of this lower bound, and the search is stopped as soon as the bound
+        for the next title is greater than the distance of the worst title
+        in the top, hence the result is exactly the same as for the sort of
+        all titles by the distance (ties by the position of titles).
+
+    """
+
+    def __init__(self, journals, n=3):
+        import numpy as np
+
+        self.journals = list(journals)
+        self.keys = [j['title'].lower() for j in self.journals]
+        self.n = n
+        self.lengths = np.array([len(key) for key in self.keys])
+
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for gram in get_grams(key, self.n):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32)
+            for gram, ids in postings.items()}
+
+    def search(self, title, count=10, chunk=256):
+        from Levenshtein import distance
+        import numpy as np
+
+        key = (title or '').lower()
+        if len(self.keys) == 0 or count <= 0:
+            return []
+
+        grams = get_grams(key, self.n)
+        ids = [self.postings[g] for g in grams if g in self.postings]
+        if len(ids):
+            score = np.bincount(np.concatenate(ids), minlength=len(self.keys))
+        else:
+            score = np.zeros(len(self.keys), dtype=np.int64)
+
+        bounds = np.maximum(-((score - len(grams)) // self.n), # Ceil
+            np.abs(self.lengths - len(key)))
+        order = np.argsort(bounds, kind='stable')
+        bounds = bounds[order]
+
+        # Titles are compared by chunks, and the best ones are selected by
+        # (distance, position) from the previous best and the new chunk
+        best = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        pos = 0
+        while pos < len(order):
+            end = pos + max(count, chunk)
+            if len(best[0]) == count:
+                dist_max = int(best[1][-1])
+                end = min(end, np.searchsorted(bounds, dist_max, 'right'))
+                if end <= pos:
+                    break
+            ids = np.concatenate([best[0], order[pos:end]])
+            dists = np.concatenate([best[1], [distance(key, self.keys[i])
+                for i in order[pos:end].tolist()]])
+            sel = np.lexsort((ids, dists))[:count]
+            best = ids[sel], dists[sel]
+            pos = end
+
+        res = zip(best[1].tolist(), best[0].tolist())
+        return [[self.journals[i], dist] for dist, i in res]
+
+
+def find_ref_years(path):
+    """Find the years of available reference files for the path pattern."""
+    folder, name = os.path.split(path)
+    prefix, suffix = name.split('{year}')
+    if not os.path.isdir(folder):
+        return []
+
+    years = []
+    for fname in os.listdir(folder):
+        if fname.startswith(prefix) and fname.endswith(suffix):
+            year = fname[len(prefix):len(fname)-len(suffix)]
+            if year.isdigit():
+                years.append(int(year))
+    return sorted(years)
+
+
+def get_grams(text, n=3):
+    text = ' ' + text + ' '
+    return {text[i:i+n] for i in range(max(len(text) - n + 1, 1))}
+
+
+def normalize_issn(issn):
+    return issn.replace('-', '').replace(' ', '').upper()
+
+
+def normalize_title(title):
+    title = title.lower().replace('&', ' and ')
+    return re.sub(r'[\W_]+', '', title)
@@ -0,0 +1,176 @@
+
+
+class Papers():
+    def __init__(self, data={}, journals=None):
+        self.data = data
+        self.journals = journals
+        self.cubes = {}
+        self.build()
+
+    def __len__(self):
+        return len(self.data)
+
+    def build(self):
+        """Build the index of papers (it is called once after loading).
+
+        Note:
+            Papers are bucketed by the author uid, year, grant uid and
+            quartile class of the journal, hence the requests from "find"
+            and "stat" are reduced to the intersections of the sets of
+            paper titles instead of the full scans of the papers table.
+
+        """
+        self.order = {}
+        self.by_author = {}
+        self.by_year = {}
+        self.by_grant = {}
+        self.by_q = {1: set(), 2: set(), 0: set()}
+
+        for i, (title, paper) in enumerate(self.data.items()):
+            self.order[title] = i
+
+            for uid in split_list(paper.get('authors_parsed')):
+                self.by_author.setdefault(uid, set()).add(title)
+
+            for uid in split_list(paper.get('grant')):
+                self.by_grant.setdefault(uid, set()).add(title)
+
+            year = int(paper['year'])
+            self.by_year.setdefault(year, set()).add(title)
+
+            self.by_q[self.get_q(paper)].add(title)
+
+    def build_cube(self, years):
+        """Build the cube of statistics for all authors and grants at once.
+
+        Note:
+            The papers table is transformed into the columns of year and
+            quartile codes and the sparse (coordinate) incidence matrices
+            author x paper and grant x paper. The numbers of papers for
+            every (author/grant, year, quartile) cell are then computed by
+            one grouped reduction (bincount) over the incidence entries.
+
+        """
+        import numpy as np
+
+        years = [int(year) for year in years]
+        titles = list(self.data.keys())
+        n_cell = len(years) * 3
+
+        pos_year = {year: i for i, year in enumerate(years)}
+        pos_q = {1: 0, 2: 1, 0: 2}
+
+        cell = np.full(len(titles), -1, dtype=np.int64)
+        for q, bucket in self.by_q.items():
+            for title in bucket:
+                year = int(self.data[title]['year'])
+                if year in pos_year:
+                    i = self.order[title]
+                    cell[i] = pos_year[year] * 3 + pos_q[q]
+
+        def reduce(buckets):
+            uids = list(buckets.keys())
+            rows = np.repeat(np.arange(len(uids), dtype=np.int64),
+                [len(buckets[uid]) for uid in uids])
+            cols = np.fromiter((self.order[title] for uid in uids
+                for title in buckets[uid]), dtype=np.int64, count=len(rows))
+            cells = cell[cols]
+            mask = cells >= 0
+            counts = np.bincount(rows[mask] * n_cell + cells[mask],
+                minlength=len(uids) * n_cell)
+            counts = counts.reshape(len(uids), len(years), 3)
+            return {uid: counts[i] for i, uid in enumerate(uids)}
+
+        counts = np.bincount(cell[cell >= 0], minlength=n_cell)
+
+        self.cubes[tuple(years)] = {
+            'years': years,
+            'all': counts.reshape(len(years), 3),
+            'authors': reduce(self.by_author),
+            'grants': reduce(self.by_grant),
+        }
+
+    def find(self, author=None, year=None, q=None, grant=None):
+        res = {}
+        for title in self.find_titles(author, year, q, grant):
+            paper = self.data[title]
+            paper['journal_object'] = self.journals.data[paper['journal']]
+            res[title] = paper
+        return res
+
+    def find_titles(self, author=None, year=None, q=None, grant=None):
+        titles = self.select(author, year, q, grant)
+        if titles is None:
+            return list(self.data.keys())
+        return sorted(titles, key=self.order.get)
+
+    def get_q(self, paper):
+        return self.journals.get_q(paper['journal'], int(paper['year']))
+
+    def select(self, author=None, year=None, q=None, grant=None):
+        buckets = []
+        if year:
+            buckets.append(self.by_year.get(int(year), set()))
+        if author:
+            buckets.append(self.by_author.get(author, set()))
+        if grant:
+            buckets.append(self.by_grant.get(grant, set()))
+        if q is not None:
+            buckets.append(self.by_q.get(q, set()))
+
+        if len(buckets) == 0:
+            return None
+
+        buckets.sort(key=len)
+        return buckets[0].intersection(*buckets[1:])
+
+    def stat(self, author=None, years=[], grant=None):
+        cube = self.cubes.get(tuple(int(y) for y in years))
+        if cube is not None:
+            if author and not grant:
+                return self.stat_cube(years, cube['authors'].get(author))
+            if grant and not author:
+                return self.stat_cube(years, cube['grants'].get(grant))
+            if not author and not grant:
+                return self.stat_cube(years, cube['all'])
+
+        return self.stat_sets(author, years, grant)
+
+    def stat_cube(self, years, counts):
+        res = {}
+        for i, year in enumerate(years):
+            q1, q2, q0 = [0, 0, 0] if counts is None else counts[i].tolist()
+            res[year] = {'q1': q1, 'q2': q2, 'q0': q0, 'total': q1 + q2 + q0}
+        res['total'] = {
+            'q1': sum(res[year]['q1'] for year in years),
+            'q2': sum(res[year]['q2'] for year in years),
+            'q0': sum(res[year]['q0'] for year in years),
+            'total': sum(res[year]['total'] for year in years),
+        }
+        return res
+
+    def stat_sets(self, author=None, years=[], grant=None):
+        base = self.select(author, grant=grant)
+
+        res = {}
+        for year in years:
+            titles = self.by_year.get(int(year), set())
+            if base is not None:
+                titles = titles & base
+            res[year] = {
+                'q1': len(titles & self.by_q[1]),
+                'q2': len(titles & self.by_q[2]),
+                'q0': len(titles & self.by_q[0]),
+                'total': len(titles),
+            }
+        res['total'] = {
+            'q1': sum(res[year]['q1'] for year in years),
+            'q2': sum(res[year]['q2'] for year in years),
+            'q0': sum(res[year]['q0'] for year in years),
+            'total': sum(res[year]['total'] for year in years),
+        }
+        return res
+
+
+def split_list(text):
+    return [v.strip() for v in (text or '').split(',') if v.strip()]
@@ -1,27 +1,159 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+import hashlib
+import json
 import os
-from pybtex.database import BibliographyDataError
-from pybtex.database import parse_string
+from pybtex.database.input.bibtex import Parser
+from pybtex.exceptions import PybtexError
+import re
 import sys
+import unicodedata
 import xlsxwriter
 
 
-from inbima import InBiMa
+from journals import Journals
+from journals import normalize_title
+from store import save_store
+from utils import hash_data
+from utils import iter_span
+from utils import save_profile
+from utils import span
+from utils import Span
 
 
 YEAR_MIN = 2017
 BIB_FOLDER_PATH = './bib_wos/'
+MANIFEST_PATH = './parser_wos_manifest.json'
+MANIFEST_VERSION = 2
+JOURNAL_FIELDS = ['Title', 'ISSN', 'Country', 'Publisher', 'SJR Rank',
+    'SJR Impact', 'SJR Q1', 'SJR Q2', 'SJR Q3', 'SJR Q4', 'Note']
+PAPER_FIELDS = ['Title', 'Year', 'Authors', 'Journal', 'Volume', 'Number',
+    'Pages', 'Site', 'PDF', 'Screen', 'DOI', 'Grant', 'Grant_str',
+    'Authors Parsed', 'Note']
+DASHES = str.maketrans({c: '-' for c in '\u2010\u2011\u2012\u2013\u2014'})
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'iu', 'я': 'ia',
+    'æ': 'ae', 'đ': 'd', 'ł': 'l', 'ø': 'o', 'œ': 'oe', 'ß': 'ss',
+})
+STORE_FOLDER = './parser_wos_result'
+WORKERS = 1
+
+
+class GrantMatcher():
+    def __init__(self, grants={}):
+        """Compile numbers of all grants into one regular expression.
+
+        Note:
+            The numbers and funding texts are normalized (see
+            "normalize_grant"), and the text is scanned once by the pattern
+            "(?=(n1|n2|...))" with numbers sorted by length, i.e., the
+            longest number is found at every position. Numbers, which are
+            substrings of the found one, are also added, hence the result is
+            the same as for the substring test of each number separately.
+
+        """
+        self.uids = {}
+        for uid, item in grants.items():
+            number = normalize_grant(str(item.get('number') or ''))
+            if number:
+                self.uids.setdefault(number, []).append(uid)
+
+        self.order = {uid: i for i, uid in enumerate(grants.keys())}
+
+        numbers = sorted(self.uids.keys(), key=lambda n: (-len(n), n))
+        self.contained = {n1: [n2 for n2 in numbers if n2 in n1]
+            for n1 in numbers}
+
+        self.pattern = None
+        if len(numbers):
+            self.pattern = re.compile('(?=(' + '|'.join(
+                re.escape(n) for n in numbers) + '))')
+
+    def find(self, text):
+        """Return the list of uids of grants mentioned in the text."""
+        if not self.pattern:
+            return []
+
+        numbers = set()
+        for number in self.pattern.findall(normalize_grant(text)):
+            numbers.update(self.contained[number])
+
+        uids = [uid for number in numbers for uid in self.uids[number]]
+        return sorted(uids, key=self.order.get)
+
+
+class TeamIndex():
+    def __init__(self, team={}):
+        """Build the index of team members for the search of authors.
+
+        Note:
+            The members are indexed by the normalized surname (see
+            "normalize_name") and by the pair of the normalized surname and
+            the first letter of the name, hence the author is resolved by
+            one lookup instead of the scan of the full team.
+
+        """
+        self.index = {}
+        for uid, item in team.items():
+            surname = normalize_name(item.get('surname'))
+            name = normalize_name(item.get('name'))
+            for key in dict.fromkeys([(surname, ''), (surname, name[:1])]):
+                self.index.setdefault(key, []).append([uid, name, item])
+
+    def find(self, surname, names=[]):
+        """Return uid of the team member for the surname and given names.
+
+        Note:
+            If the first given name is full, then it should be equal to the
+            name of the team member. Otherwise the member is searched by the
+            initials of all given names (WoS may put the middle initial
+            first, e.g., "Burnaev, V, Evgeny").
+
+        """
+        surname_norm = normalize_name(surname)
+        names_norm = [normalize_name(name) for name in names]
+        names_norm = [name for name in names_norm if name]
+
+        if len(names_norm) and len(names_norm[0]) >= 2:
+            name = names[0]
+            for uid, item_name, item in self.index.get((surname_norm, ''), []):
+                if names_norm[0] != item_name:
+                    print(f'> !!! Surnames "{surname}" are equal but names ("{name}" vs "{item["name"]}") not. Skip')
+                    continue
+                return uid
+            return
+
+        for initial in [name[0] for name in names_norm] or ['']:
+            items = self.index.get((surname_norm, initial))
+            if items:
+                return items[0][0]
+
 
+def load_manifest():
+    manifest = {'version': MANIFEST_VERSION, 'context': None, 'files': {}}
+    if os.path.isfile(MANIFEST_PATH):
+        with open(MANIFEST_PATH, 'r') as f:
+            data = json.load(f)
+        if data.get('version') == MANIFEST_VERSION:
+            manifest = data
+    return manifest
 
-def parse_author(data, team={}):
+
+def parse_author(data, team_index=None):
     authors = ''
     authors_parsed = ''
 
     for author_object in data:
         author = str(author_object)
         author = author.replace(',', '')
-        author = author.split(' ')[:2]
-        surname, name = author if len(author) == 2 else [author, '']
-        name = name.replace('.', '')
+        author = author.split(' ')
+        names = [name.replace('.', '') for name in author[1:]]
+        surname = author[0]
+        name = names[0] if len(names) else ''
         name_char = name[0] if name else None
 
         if name_char:
@@ -29,14 +161,7 @@ def parse_author(data, team={}):
         else:
             author = surname + ', '
 
-        uid_found = None
-        for uid, item in team.items():
-            if surname.lower() == item['surname'].lower():
-                if len(name) >= 2 and name.lower() != item['name'].lower():
-                    print(f'> !!! Surnames "{surname}" are equal but names ("{name}" vs "{item["name"]}") not. Skip')
-                    continue
-                uid_found = uid
-                break
+        uid_found = team_index.find(surname, names) if team_index else None
 
         authors += author
         authors_parsed += uid_found + ', ' if uid_found else author
@@ -47,183 +172,388 @@ def parse_author(data, team={}):
     return authors[:-2], authors_parsed[:-2]
 
 
-def parse_grant(grant_str, grants={}):
-    if not grant_str or len(grant_str) < 5:
+def parse_grant(grant_str, grant_matcher=None):
+    if not grant_str or len(grant_str) < 5 or not grant_matcher:
         return
 
-    grant = []
-    for uid, item in grants.items():
-        if item['number'].lower() in grant_str.lower():
-            grant.append(uid)
-    return ', '.join(grant)
+    return ', '.join(grant_matcher.find(grant_str))
 
 
-def load_bibs(uids):
-    bibs = None
+def load_bibs(uids, workers=WORKERS):
+    """Yield parsed entries (file, key, entry) from files without duplicates.
 
-    for uid in uids:
-        bib_file = BIB_FOLDER_PATH + uid + '.bib'
-        print(f'> ... Parse bib file : ', bib_file)
+    Note:
+        Files are read line by line and each entry is parsed separately
+        as soon as its closing brace is found, so the memory does not grow
+        with the number of entries in the files. Duplicated entries (with
+        the same key or DOI, or with the same title, year and first author
+        if there is no DOI) are skipped on the fly by the set of short hashes
+        of entries (see "get_entry_hash").
 
-        with open(bib_file, 'r') as f:
-            data = f.read()
-        data = data.replace('Early Access Date', 'EarlyAccessDate')
+        If the number of workers is greater than 1, then the files are
+        parsed in the pool of processes, and the entries are merged and
+        deduplicated in the order of files (as in the serial mode).
+
+    """
+    hashes = set()
+
+    bib_files = [BIB_FOLDER_PATH + uid + '.bib' for uid in uids]
 
-        if bibs is None:
-            bibs = parse_string(data, bib_format='bibtex')
+    with ProcessPoolExecutor(workers) if workers > 1 else nullcontext() as ex:
+        if ex is None:
+            entries_list = map(load_bib_file, bib_files)
         else:
-            bibs_ = parse_string(data, bib_format='bibtex')
+            entries_list = ex.map(load_bib_file_list, bib_files)
+
+        for bib_file, entries in zip(bib_files, entries_list):
+            print(f'> ... Parse bib file : ', bib_file)
+
+            for key, entry in entries:
+                keys = [get_hash('key', key), get_entry_hash(entry)]
+                keys = [k for k in keys if k is not None]
+                if any(k in hashes for k in keys):
+                    continue # Duplicated entry
+                hashes.update(keys)
+                yield bib_file, key, entry
+
+
+def load_bib_file(bib_file):
+    """Yield parsed bibtex entries (key, entry) from the file one by one."""
+    for data in load_bib_texts(bib_file):
+        data = data.replace('Early Access Date', 'EarlyAccessDate')
+
+        try:
+            bibs = Parser().parse_string(data)
+        except PybtexError as e:
+            print(f'> !!! Invalid entry in "{bib_file}" ({e}). Skip')
+            continue
+
+        for key, entry in bibs.entries.items():
+            yield key, entry
+
+
+def load_bib_file_list(bib_file):
+    return list(load_bib_file(bib_file))
+
+
+def load_bib_texts(bib_file):
+    """Yield texts of bibtex entries (from "@" to closing brace) from file."""
+    lines = []
+    depth = 0
+    seen_brace = False
+
+    with open(bib_file, 'r') as f:
+        for line in f:
+            if depth == 0:
+                if not line.lstrip('\ufeff \t').startswith('@'):
+                    continue
+                lines = []
+
+            lines.append(line)
+            depth += line.count('{') - line.count('}')
+            seen_brace = seen_brace or depth > 0
 
-            for key, entry in bibs_.entries.items():
-                try:
-                    bibs.add_entry(key, entry)
-                except BibliographyDataError:
-                    pass # Duplicated entry
+            if depth <= 0 and seen_brace:
+                yield ''.join(lines)
+                lines = []
+                depth = 0
+                seen_brace = False
 
-    return bibs
+    if len(lines):
+        yield ''.join(lines)
 
 
-def run(uids):
-    ibm = InBiMa()
+def get_entry_hash(entry):
+    """Return the hash of the entry by DOI (or by title, year and author).
 
-    bibs = load_bibs(uids)
+    Note:
+        If there is no DOI, then the hash is built by the title, the year and
+        the surname of the first author. If there is no title either, then
+        None is returned (such entry is never treated as a duplicate).
+
+    """
+    doi = (entry.fields.get('doi') or '').strip('{} ').lower()
+    if doi:
+        return get_hash('doi', doi)
+
+    title = normalize_title(entry.fields.get('title') or '')
+    if not title:
+        return
+    year = (entry.fields.get('year') or '').strip('{} ')
+    persons = entry.persons.get('author') or []
+    author = ' '.join(persons[0].last_names).lower() if len(persons) else ''
+    return get_hash('title', '|'.join([title, year, author]))
+
+
+def get_table(fields, rows):
+    """Transform rows into the table (as it is loaded by "load_sheet")."""
+    fields = [field.lower().replace(' ', '_') for field in fields]
+
+    table = {}
+    for values in rows:
+        row = {}
+        for field, value in zip(fields, values):
+            if value is not None and value != ' ':
+                row[field] = value
+        table[values[0]] = row
+    return table
+
+
+def get_delta(files_old, files_new):
+    """Return the list of new, changed and removed papers (for bib files).
+
+    Note:
+        The papers are compared only for the files in "files_new", hence the
+        removed files should be given there without entries (then all their
+        papers are removed, unless they are found in other files).
+
+    """
+    res_old = {}
+    res_new = {}
+    for bib_file in files_new.keys():
+        for tag, item in files_old.get(bib_file, {}).items():
+            if item['res'] is not None:
+                res_old.setdefault(tag, item['res'])
+        for tag, item in files_new[bib_file].items():
+            if item['res'] is not None:
+                res_new.setdefault(tag, item['res'])
+
+    delta = []
+    for tag, res in res_new.items():
+        if not tag in res_old:
+            delta.append(['new', tag, res])
+        elif res['row'] != res_old[tag]['row']:
+            delta.append(['changed', tag, res])
+    for tag, res in res_old.items():
+        if not tag in res_new:
+            delta.append(['removed', tag, res])
+    return delta
+
+
+def get_entry_content_hash(entry):
+    data = [entry.type, list(entry.fields.items()),
+        [[role, [str(p) for p in persons]]
+            for role, persons in entry.persons.items()]]
+    return hash_data(data)
+
+
+def get_hash(kind, value):
+    value = (kind + ':' + value).encode('utf-8')
+    return hashlib.blake2b(value, digest_size=8).digest()
+
+
+def parse_entry(tag, bib, team_index=None, grant_matcher=None,
+                journals_ref=None):
+    """Resolve authors, journal and grants for the bibtex entry.
+
+    Returns:
+        dict: the result with the row for the papers sheet ("row"), the flag
+        for conference papers ("is_conf"), the journal info ("journal") and
+        the flag for not recognized journals ("is_unknown"). If the entry
+        should be skipped, then None is returned.
+
+    """
+    is_paper_conf = False
+    is_unknown = False
+    journal_object = None
+
+    title = (bib.fields.get('title') or '{}')[1:-1]
+    if not title:
+        print(f'> !!! No title for paper "{tag}"')
+        return
+    title = title.replace('\n', ' ')
+
+    year = (bib.fields.get('year') or '{}')[1:-1]
+    if not year:
+        print(f'> !!! No year for paper "{title}"')
+        return
+    if int(year) < YEAR_MIN:
+        return
+
+    authors, authors_parsed = parse_author(bib.persons['author'], team_index)
+    if not authors:
+        print(f'> !!! No authors for paper "{title}"')
+        return
+
+    issn = (bib.fields.get('issn') or '{}')[1:-1]
+    journal = (bib.fields.get('journal') or '{}')[1:-1]
+    if not journal:
+        journal = (bib.fields.get('booktitle') or '{}')[1:-1]
+        if not journal:
+            print(f'> !!! No journal/booktitle for paper "{title}"')
+            return
+        is_paper_conf = True
+        journal = journal.replace('\n', ' ')
+    else:
+        journal_object = journals_ref.get_journal(journal, issn)
+        if journal_object:
+            journal = journal_object['title']
+        else:
+            print(f'> ! Journal "{journal.lower()}" is not recognized for paper "{title}"')
+            journal_object = {'title': journal, 'issn': issn}
+            is_unknown = True
+
+    volume = (bib.fields.get('volume') or '{ }')[1:-1]
+    number = (bib.fields.get('number') or '{ }')[1:-1]
+    pages = (bib.fields.get('pages') or '{ }')[1:-1]
+    grant_str = (bib.fields.get('Funding-Text') or '{ }')[1:-1]
+    grant = parse_grant(grant_str, grant_matcher) or ' '
+
+    note = ' '
+    if is_paper_conf:
+        note += (bib.fields.get('series') or '{ }')[1:-1] + ' '
+        note += (bib.fields.get('note') or '{ }')[1:-1] + ' '
+        note += (bib.fields.get('organization') or '{ }')[1:-1] + ' '
+
+    row = [title, year, authors, journal, volume, number, pages, ' ', ' ',
+        ' ', ' ', grant, grant_str, authors_parsed, note]
+
+    return {
+        'row': row,
+        'is_conf': is_paper_conf,
+        'journal': journal_object,
+        'is_unknown': is_unknown,
+    }
+
+
+def run(uids, workers=WORKERS, with_store=False, is_full=False):
+    """Parse bibtex files and save the results into the excel file.
+
+    Note:
+        The content hash and the result of parsing for each entry of each
+        bib file are saved in the manifest file MANIFEST_PATH. On the next
+        run, the authors, journals and grants are resolved only for the new
+        or modified entries (if team, grants and journals info are the same
+        as for the previous run), and the sheet "papers_delta" with the new,
+        changed and removed papers is saved in addition to the full output.
+        If the flag "is_full" is set (all files of the folder are parsed),
+        then the files of the manifest which are absent in "uids" are
+        treated as removed, i.e., their papers are marked as removed in the
+        delta, and the files are dropped from the manifest.
+        If the flag "with_store" is set, then the parsed papers and journals
+        are also saved into the columnar store STORE_FOLDER (see "store.py")
+        in the same format as the tables loaded from the excel sheets. The
+        time and memory of stages are saved into the file of the profile in
+        the export folder (see "save_profile").
+
+    """
+    from inbima import InBiMa
+
+    ibm = InBiMa(with_tasks=False)
+    journals_ref = Journals()
+    journals_ref.load_ref()
+    team_index = TeamIndex(ibm.team)
+    grant_matcher = GrantMatcher(ibm.grants)
+
+    context = hash_data([ibm.team, ibm.grants, YEAR_MIN,
+        journals_ref.get_ref_db_meta()])
+    manifest = load_manifest()
+    cache = manifest['files'] if manifest['context'] == context else {}
+    files = {BIB_FOLDER_PATH + uid + '.bib': {} for uid in uids}
 
     wb = xlsxwriter.Workbook(f'./parser_wos_result.xlsx')
     ws1 = wb.add_worksheet('papers_parsed')
     ws2 = wb.add_worksheet('papers_conf_parsed')
     ws3 = wb.add_worksheet('journals_parsed')
     ws4 = wb.add_worksheet('fields_parsed')
+    ws5 = wb.add_worksheet('papers_delta')
 
     for ws in [ws1, ws2]:
-        ws.write(0, 0, 'Title')
-        ws.write(0, 1, 'Year')
-        ws.write(0, 2, 'Authors')
-        ws.write(0, 3, 'Journal')
-        ws.write(0, 4, 'Volume')
-        ws.write(0, 5, 'Number')
-        ws.write(0, 6, 'Pages')
-        ws.write(0, 7, 'Site')
-        ws.write(0, 8, 'PDF')
-        ws.write(0, 9, 'Screen')
-        ws.write(0, 10, 'DOI')
-        ws.write(0, 11, 'Grant')
-        ws.write(0, 12, 'Grant_str')
-        ws.write(0, 13, 'Authors Parsed')
-        ws.write(0, 14, 'Note')
+        for j, field in enumerate(PAPER_FIELDS):
+            ws.write(0, j, field)
 
     ind_paper = 0
     ind_conf = 0
+    count_parsed = 0
+    tables = {'papers_parsed': [], 'papers_conf_parsed': [],
+        'journals_parsed': []} # The rows are collected only for the store
     journals = {}
-    for tag, bib in (bibs.entries.items() if bibs else []):
-        is_paper_conf = False
-
-        title = (bib.fields.get('title') or '{}')[1:-1]
-        if not title:
-            print(f'> !!! No title for paper "{tag}"')
-            continue
-        title = title.replace('\n', ' ')
-
-        year = (bib.fields.get('year') or '{}')[1:-1]
-        if not year:
-            print(f'> !!! No year for paper "{title}"')
-            continue
-        if int(year) < YEAR_MIN:
+    journals_unknown = []
+    sp_load = Span('load_bibs', workers=workers)
+    sp_parse = Span('parse_entry')
+    for bib_file, tag, bib in iter_span(sp_load, load_bibs(uids, workers)):
+        content = get_entry_content_hash(bib)
+
+        item = cache.get(bib_file, {}).get(tag)
+        if item and item['hash'] == content:
+            res = item['res']
+        else:
+            with sp_parse:
+                res = parse_entry(tag, bib, team_index, grant_matcher,
+                    journals_ref)
+            sp_parse.count += 1
+            count_parsed += 1
+
+        files.setdefault(bib_file, {})[tag] = {'hash': content, 'res': res}
+        if res is None:
             continue
 
-        authors, authors_parsed = parse_author(bib.persons['author'], ibm.team)
-        if not authors:
-            print(f'> !!! No authors for paper "{title}"')
-            continue
+        if res['journal']:
+            journal = res['row'][3]
+            journals[journal] = dict(res['journal'])
+            if res['is_unknown']:
+                journals_unknown.append(journal)
 
-        issn = (bib.fields.get('issn') or '{}')[1:-1]
-        journal = (bib.fields.get('journal') or '{}')[1:-1]
-        if not journal:
-            journal = (bib.fields.get('booktitle') or '{}')[1:-1]
-            if not journal:
-                print(f'> !!! No journal/booktitle for paper "{title}"')
-                continue
-            is_paper_conf = True
-            journal = journal.replace('\n', ' ')
-        else:
-            journal_object = ibm.get_journal(journal, issn)
-            if journal_object:
-                journal = journal_object['title']
-                journals[journal] = journal_object
-            else:
-                print(f'> ! Journal "{journal.lower()}" is not recognized for paper "{title}"')
-                journals[journal] = {'title': journal, 'issn': issn}
-
-        volume = (bib.fields.get('volume') or '{ }')[1:-1]
-        number = (bib.fields.get('number') or '{ }')[1:-1]
-        pages = (bib.fields.get('pages') or '{ }')[1:-1]
-        grant_str = (bib.fields.get('Funding-Text') or '{ }')[1:-1]
-        grant = parse_grant(grant_str, ibm.grants) or ' '
-
-        note = ' '
-        if is_paper_conf:
-            note += (bib.fields.get('series') or '{ }')[1:-1] + ' '
-            note += (bib.fields.get('note') or '{ }')[1:-1] + ' '
-            note += (bib.fields.get('organization') or '{ }')[1:-1] + ' '
-
-        if is_paper_conf:
+        if res['is_conf']:
             ind_conf += 1
             ind = ind_conf
             ws = ws2
+            if with_store:
+                tables['papers_conf_parsed'].append(res['row'])
         else:
             ind_paper += 1
             ind = ind_paper
             ws = ws1
-
-        ws.write(ind, 0, title)
-        ws.write(ind, 1, year)
-        ws.write(ind, 2, authors)
-        ws.write(ind, 3, journal)
-        ws.write(ind, 4, volume)
-        ws.write(ind, 5, number)
-        ws.write(ind, 6, pages)
-        ws.write(ind, 7, ' ')
-        ws.write(ind, 8, ' ')
-        ws.write(ind, 9, ' ')
-        ws.write(ind, 10, ' ')
-        ws.write(ind, 11, grant)
-        ws.write(ind, 12, grant_str)
-        ws.write(ind, 13, authors_parsed)
-        ws.write(ind, 14, note)
+            if with_store:
+                tables['papers_parsed'].append(res['row'])
+
+        for j, value in enumerate(res['row']):
+            ws.write(ind, j, value)
+
+    print(f'> ... Resolved entries : {count_parsed} (new or changed)')
+    sp_load.close()
+    sp_parse.close()
+
+    journals_unknown = list(dict.fromkeys(journals_unknown))
+    with span('find_journals') as sp:
+        res = journals_ref.find_many(journals_unknown,
+            journals_ref.get_ref_sjr())
+        sp.count = len(journals_unknown)
+    for journal, (_, titles) in zip(journals_unknown, res):
+        if len(titles):
+            note = 'Similar: ' + '; '.join(f'"{t}"' for t in titles[:3])
+            journals[journal]['note'] = note
 
     ws = ws3
-    ws.write(0, 0, 'Title')
-    ws.write(0, 1, 'ISSN')
-    ws.write(0, 2, 'Country')
-    ws.write(0, 3, 'Publisher')
-    ws.write(0, 4, 'SJR Rank')
-    ws.write(0, 5, 'SJR Impact')
-    ws.write(0, 6, 'SJR Q1')
-    ws.write(0, 7, 'SJR Q2')
-    ws.write(0, 8, 'SJR Q3')
-    ws.write(0, 9, 'SJR Q4')
-    ws.write(0, 10, 'Note')
+    for j, field in enumerate(JOURNAL_FIELDS):
+        ws.write(0, j, field)
 
     ind = 0
     for item in journals.values():
         ind += 1
-        ws.write(ind, 0, item.get('title', ' '))
-        ws.write(ind, 1, item.get('issn', ' '))
-        ws.write(ind, 2, item.get('country', ' '))
-        ws.write(ind, 3, item.get('publisher', ' '))
-        ws.write(ind, 4, item.get('sjr_rank', ' '))
-        ws.write(ind, 5, item.get('sjr_impact', ' '))
-        ws.write(ind, 6, item.get('sjr_q1', ' '))
-        ws.write(ind, 7, item.get('sjr_q2', ' '))
-        ws.write(ind, 8, item.get('sjr_q3', ' '))
-        ws.write(ind, 9, item.get('sjr_q4', ' '))
-        ws.write(ind, 10, item.get('note', ' '))
-
-    quartile_names = []
+        row = [
+            item.get('title', ' '),
+            item.get('issn', ' '),
+            item.get('country', ' '),
+            item.get('publisher', ' '),
+            item.get('sjr_rank', ' '),
+            item.get('sjr_index', ' '),
+            '; '.join(item.get('sjr_q1', [])) or ' ',
+            '; '.join(item.get('sjr_q2', [])) or ' ',
+            '; '.join(item.get('sjr_q3', [])) or ' ',
+            '; '.join(item.get('sjr_q4', [])) or ' ',
+            item.get('note', ' '),
+        ]
+        if with_store:
+            tables['journals_parsed'].append(row)
+        for j, value in enumerate(row):
+            ws.write(ind, j, value)
+
+    quartile_names = set()
     for item in journals.values():
-        for quartile_name in item.get('sjr_quartiles', {}).keys():
-            if not quartile_name in quartile_names:
-                quartile_names.append(quartile_name)
-    quartile_names.sort()
+        for kind in ['sjr_q1', 'sjr_q2', 'sjr_q3', 'sjr_q4', 'sjr_q0']:
+            quartile_names.update(item.get(kind, []))
+    quartile_names = sorted(quartile_names)
 
     ws = ws4
     ws.write(0, 0, 'SJR quartile fields')
@@ -233,15 +563,94 @@ def run(uids):
         ind += 1
         ws.write(ind, 0, quartile_name)
 
+    ws = ws5
+    ws.write(0, 0, 'Status')
+    ws.write(0, 1, 'Key')
+    for j, field in enumerate(PAPER_FIELDS, 2):
+        ws.write(0, j, field)
+
+    files_removed = {}
+    if is_full:
+        files_removed = {bib_file: {} for bib_file in manifest['files']
+            if not bib_file in files}
+
+    ind = 0
+    for status, tag, res in get_delta(manifest['files'],
+                                      {**files, **files_removed}):
+        ind += 1
+        ws.write(ind, 0, status)
+        ws.write(ind, 1, tag)
+        for j, value in enumerate(res['row'], 2):
+            ws.write(ind, j, value)
+
     wb.close()
 
+    manifest['files'].update(files)
+    for bib_file in files_removed:
+        del manifest['files'][bib_file]
+    manifest['context'] = context
+    save_manifest(manifest)
 
-if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        uids = [sys.argv[1]]
+    if with_store:
+        for name, rows in tables.items():
+            fields = PAPER_FIELDS if name != 'journals_parsed' else \
+                JOURNAL_FIELDS
+            tables[name] = get_table(fields, rows)
+        save_store(STORE_FOLDER, tables)
+
+    save_profile(ibm.fs.get_path('profile_parser_wos.json'))
+
+
+def normalize_grant(text):
+    """Fold the grant number (or text) to lowercase without spaces."""
+    text = text.lower().translate(DASHES)
+    text = re.sub(r'\b(no|nr|n°)\.?(?=\s*\d)|№', '', text)
+    return re.sub(r'\s+', '', text)
+
+
+def normalize_name(text):
+    """Fold the name to lowercase latin letters without diacritics."""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.translate(TRANSLIT)
+    return re.sub(r'[\W_]+', '', text)
+
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(MANIFEST_PATH + '.tmp', MANIFEST_PATH)
+
+
+def run_cli(args):
+    """Run the parser with the arguments of the script "[-w N] [-p] [UID]".
+
+    Note:
+        It is also called by the subcommand "parse-wos" of the main script
+        (i.e., "python inbima.py parse-wos [-w N] [-p] [UID]").
+
+    """
+    args = list(args)
+    workers = WORKERS
+    with_store = False
+    while len(args) and args[0] in ['-w', '-p']:
+        if args[0] == '-w':
+            workers = int(args[1])
+            args = args[2:]
+        else:
+            with_store = True
+            args = args[1:]
+
+    is_full = len(args) == 0
+    if not is_full:
+        uids = [args[0]]
     else:
         files = os.listdir(BIB_FOLDER_PATH)
         uids = [f.split('.')[0] for f in files if f.endswith('.bib')]
         uids.sort()
 
-    run(uids)
+    run(uids, workers, with_store, is_full)
+
+
+if __name__ == '__main__':
+    run_cli(sys.argv[1:])
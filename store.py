@@ -0,0 +1,168 @@
+import datetime
+import json
+import os
+import time
+
+
+from utils import hash_file
+from utils import log
+from utils import log_perf
+
+
+STORE_VERSION = 1
+STORE_TYPES = {
+    bool: 'bool',
+    datetime.date: 'date',
+    datetime.datetime: 'datetime',
+    datetime.time: 'time',
+    datetime.timedelta: 'timedelta',
+    float: 'float',
+    int: 'int',
+    str: 'str',
+}
+
+
+def get_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError:
+        text = 'The package "pyarrow" is required for the columnar store'
+        log(text + ' (pip install pyarrow)', 'err')
+
+
+def hash_store(folder, names):
+    """Return the list of hashes of the given tables in the store folder."""
+    return [hash_file(get_store_path(folder, name)) for name in names]
+
+
+def is_store(folder, names):
+    """Check if all given tables are present in the store folder."""
+    return all(os.path.isfile(get_store_path(folder, name)) for name in names)
+
+
+def get_store_mtime(folder, names):
+    return min(os.path.getmtime(get_store_path(folder, name))
+        for name in names)
+
+
+def get_store_path(folder, name):
+    return os.path.join(folder, name + '.parquet')
+
+
+def load_store(folder, names):
+    """Load the given tables from the columnar (parquet) store.
+
+    Note:
+        The result has the same structure as for the "load_book" function,
+        i.e., the dict of tables, where each table is the dict of rows (by
+        the value of the first column), and each row is the dict of not
+        empty values.
+
+    """
+    pa = get_pyarrow()
+
+    data = {}
+    for name in names:
+        t = time.perf_counter()
+        data[name] = load_table(pa, get_store_path(folder, name))
+        text = f'Table "{name}" is loaded ({len(data[name])} rows)'
+        log(text + log_perf(t), 'res')
+
+    return data
+
+
+def load_table(pa, fpath):
+    table = pa.parquet.read_table(fpath)
+    meta = json.loads(table.schema.metadata[b'inbima'])
+    if meta.get('version') != STORE_VERSION:
+        log(f'Invalid version of the store file "{fpath}"', 'err')
+
+    fields = table.column_names
+    columns = []
+    for field in fields:
+        values = table.column(field).to_pylist()
+        if field in meta['mixed']:
+            values = [None if v is None else parse_value(v) for v in values]
+        columns.append(values)
+
+    res = {}
+    for values in zip(*columns):
+        row = {}
+        for field, value in zip(fields, values):
+            if value is not None:
+                row[field] = value
+        res[values[0]] = row
+
+    return res
+
+
+def parse_value(text):
+    kind, value = json.loads(text)
+    if kind == 'date':
+        return datetime.date.fromisoformat(value)
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    if kind == 'time':
+        return datetime.time.fromisoformat(value)
+    if kind == 'timedelta':
+        return datetime.timedelta(*value)
+    return value
+
+
+def save_store(folder, data):
+    """Save the given tables into the columnar (parquet) store.
+
+    Note:
+        Each table is saved into the separate file "folder/NAME.parquet"
+        column by column. If the values of some column have different types
+        (e.g., numbers and strings in the same column of the excel sheet),
+        then they are saved as json strings with the type names, hence the
+        loaded data is exactly the same as the saved one.
+
+    """
+    pa = get_pyarrow()
+
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    for name, table in data.items():
+        fpath = get_store_path(folder, name)
+        save_table(pa, fpath, table)
+        log(f'Table "{name}" is saved to "{fpath}"', 'res')
+
+
+def save_table(pa, fpath, table):
+    fields = {}
+    for row in table.values():
+        fields.update(dict.fromkeys(row.keys()))
+
+    columns = []
+    mixed = []
+    for field in fields:
+        values = [row.get(field) for row in table.values()]
+        kinds = {type(v) for v in values if v is not None}
+        if len(kinds) > 1 or (kinds and not kinds <= set(STORE_TYPES)):
+            values = [None if v is None else dump_value(v) for v in values]
+            mixed.append(field)
+        columns.append(pa.array(values))
+
+    meta = json.dumps({'version': STORE_VERSION, 'mixed': mixed})
+    schema = pa.schema([pa.field(field, column.type)
+        for field, column in zip(fields, columns)], metadata={'inbima': meta})
+    table = pa.Table.from_arrays(columns, schema=schema)
+
+    pa.parquet.write_table(table, fpath + '.tmp')
+    os.replace(fpath + '.tmp', fpath)
+
+
+def dump_value(value):
+    kind = STORE_TYPES.get(type(value), 'str')
+    if kind in ['date', 'datetime', 'time']:
+        return json.dumps([kind, value.isoformat()])
+    if kind == 'timedelta':
+        value = [value.days, value.seconds, value.microseconds]
+    if kind == 'str':
+        value = str(value)
+    return json.dumps([kind, value])
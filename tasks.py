@@ -0,0 +1,226 @@
+import re
+
+
+from papers import split_list
+from utils import log
+
+
+TASK_FORMATS = {
+    'cv': ['docx'],
+    'grant': ['docx'],
+    'stat': ['png', 'pdf', 'svg'],
+}
+TASK_GRANT = '#megagrant1'
+TASK_QUARTILES = [1, 2, 0]
+
+
+class Tasks():
+    def __init__(self, data={}, team={}, grants={}, years=[],
+                 is_strict=False):
+        """Plan of reports built from the specs of the "INBIMA" sheet.
+
+        Args:
+            data (dict): the specs of reports (rows of the "INBIMA" sheet by
+                their ids, the id is added to the file names of plots) with
+                the fields "kind" (cv, grant or stat), "authors" and
+                "grants" (lists of uids, if they are not set, then all team
+                members / grants are used), "years" (list of years or the
+                range like "2017-2021"), "quartiles" (list of quartile
+                classes, like "Q1, Q2, other") and "format" (docx for cv and
+                grant; png, pdf or svg for stat). If there are no specs, then
+                the default plan is used (CVs for all team members, papers
+                for the main grant and the plot for active lead members).
+            team (dict): the team members.
+            grants (dict): the grants.
+            years (list): the default years for reports.
+            is_strict (bool): if True, then the invalid uids of team members
+                and grants in specs are errors, otherwise only warnings are
+                logged, and the reports for them are planned (they fail in
+                isolation from other reports, see "InBiMa.run_job").
+
+        """
+        self.data = data
+        self.team = team
+        self.grants = grants
+        self.years = years
+        self.is_strict = is_strict
+
+        self.jobs = []
+        self.plan()
+
+    def add(self, kind, uid=None, authors=[], years=None, quartiles=None,
+            fmt=None, spec=None):
+        """Add the job to the plan if its report is not planned yet.
+
+        Note:
+            The jobs are deduplicated by the file names of their reports (see
+            "get_fname"), hence two jobs never overwrite the same file. The
+            id of the spec ("spec") is saved only for the plots, since they
+            differ by the authors, which are not in the file names.
+
+        """
+        if not kind in TASK_FORMATS:
+            log(f'Invalid kind of report "{kind}" in task', 'err')
+
+        years = [int(year) for year in (years or self.years)]
+        quartiles = list(quartiles or TASK_QUARTILES)
+        fmt = fmt or TASK_FORMATS[kind][0]
+        if not fmt in TASK_FORMATS[kind]:
+            log(f'Invalid format "{fmt}" of report "{kind}"', 'err')
+
+        job = {
+            'kind': kind,
+            'uid': uid,
+            'authors': list(authors),
+            'years': years,
+            'quartiles': quartiles,
+            'format': fmt,
+            'spec': spec,
+        }
+        fname = self.get_fname(job)
+        for job_planned in self.jobs:
+            if self.get_fname(job_planned) == fname:
+                if job_planned != job:
+                    log(f'Report "{fname}" is planned by different specs '
+                        '(the first one is used)', 'wrn')
+                return
+        self.jobs.append(job)
+
+    def get_fname(self, job):
+        """Return the file name of the report for the job."""
+        suffix = get_job_suffix(job, self.years)
+        if job['kind'] == 'cv':
+            person = self.team.get(job['uid'])
+            if person is None: # The job is failed later (see "InBiMa")
+                return 'CAIT_' + str(job['uid'])[1:] + suffix + '.docx'
+            name = person['surname'] + '_' + person['name']
+            return 'CAIT_' + name + suffix + '.docx'
+        if job['kind'] == 'grant':
+            return 'CAIT_' + str(job['uid'])[1:] + suffix + '.docx'
+        return 'plot' + suffix + '.' + job['format']
+
+    def get_years(self):
+        """Return the list of distinct sets of years used by jobs."""
+        res = []
+        for job in self.jobs:
+            if not job['years'] in res:
+                res.append(job['years'])
+        return res
+
+    def plan(self):
+        """Expand the specs into the list of jobs (without duplicates).
+
+        Note:
+            Each spec may result in many jobs (e.g., the CV for each of the
+            given authors), and the same job may be requested by different
+            specs, but it will be done only once. The papers and statistics
+            are then requested for all jobs through the shared indexes (and
+            cached, see "InBiMa.run_tasks"), hence the cost of the batch of
+            reports is close to the single pass over the data.
+
+        """
+        if len(self.data) == 0:
+            leads = [uid for uid, item in self.team.items()
+                if item.get('active') == 'Yes' and item.get('lead') == 'Yes']
+            for uid in self.team.keys():
+                self.add('cv', uid)
+            self.add('grant', TASK_GRANT)
+            self.add('stat', None, leads)
+            return
+
+        for spec_id, spec in self.data.items():
+            kind = str(spec.get('kind', '')).strip().lower()
+            if not kind in TASK_FORMATS:
+                log(f'Invalid kind of report "{kind}" in task', 'err')
+
+            years = parse_years(spec.get('years'))
+            quartiles = parse_quartiles(spec.get('quartiles'))
+
+            fmt = str(spec.get('format') or TASK_FORMATS[kind][0]).lower()
+
+            kind_log = 'err' if self.is_strict else 'wrn'
+
+            authors = split_list(str(spec.get('authors') or ''))
+            for uid in authors:
+                if not uid in self.team:
+                    log(f'Invalid team member uid "{uid}" in task', kind_log)
+
+            grants = split_list(str(spec.get('grants') or ''))
+            for uid in grants:
+                if not uid in self.grants:
+                    log(f'Invalid grant uid "{uid}" in task', kind_log)
+
+            if kind == 'cv':
+                for uid in authors or list(self.team.keys()):
+                    self.add(kind, uid, [], years, quartiles, fmt)
+            elif kind == 'grant':
+                for uid in grants or list(self.grants.keys()):
+                    self.add(kind, uid, [], years, quartiles, fmt)
+            else:
+                self.add(kind, None, authors or list(self.team.keys()),
+                    years, quartiles, fmt, parse_spec_id(spec_id))
+
+
+def get_job_name(job, years):
+    """Return the short name of the job for logs (e.g., "cv #uid").
+
+    Args:
+        job (dict): the job (see "Tasks.add").
+        years (list): the default years, which are not added to the name
+            (as well as the default quartiles, see "get_job_suffix").
+
+    """
+    if job['kind'] == 'stat':
+        return f'stat {job["format"]}{get_job_suffix(job, years)}'
+    return f'{job["kind"]} {job["uid"]}{get_job_suffix(job, years)}'
+
+
+def get_job_suffix(job, years):
+    """Return the suffix for the file name of the report (non-default)."""
+    suffix = ''
+    if job['spec'] is not None:
+        suffix += '_' + job['spec']
+    if job['years'] != years:
+        suffix += f'_{job["years"][0]}'
+        if len(job['years']) > 1:
+            suffix += f'-{job["years"][-1]}'
+    if job['quartiles'] != TASK_QUARTILES:
+        suffix += '_' + ''.join(f'q{q}' for q in job['quartiles'])
+    return suffix
+
+
+def parse_quartiles(text):
+    res = []
+    for item in split_list(str(text or '')):
+        item = item.lower()
+        if item in ['other', 'others', 'q0', '0']:
+            res.append(0)
+        elif item in ['q1', '1']:
+            res.append(1)
+        elif item in ['q2', '2']:
+            res.append(2)
+        else:
+            log(f'Invalid quartile "{item}" in task', 'err')
+    return [q for q in TASK_QUARTILES if q in res]
+
+
+def parse_spec_id(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return re.sub(r'[^\w-]+', '_', str(value)).strip('_') or None
+
+
+def parse_years(text):
+    if isinstance(text, float):
+        text = int(text)
+
+    res = []
+    for item in split_list(str(text or '')):
+        match = re.fullmatch(r'(\d{4})\s*-\s*(\d{4})', item)
+        if match:
+            res.extend(range(int(match.group(1)), int(match.group(2)) + 1))
+        elif item.isdigit():
+            res.append(int(item))
+        else:
+            log(f'Invalid year "{item}" in task', 'err')
+    return sorted(set(res))
@@ -0,0 +1,116 @@
+"""Tests of the cached downloads (see "FS.download") with the local server.
+
+Run as "python -m unittest discover tests" from the root folder of
+the repository. The Google Drive is replaced by the local HTTP server, which
+returns the file with the ETag, answers 304 for the conditional requests
+with the same ETag, and counts the requests.
+
+"""
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+
+import fs
+
+
+CONTENT = b'photo'
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        uid = parse_qs(urlparse(self.path).query)['id'][0]
+        is_modified = self.headers.get('If-None-Match') != ETAG
+        with self.server.lock:
+            self.server.requests.append([uid, is_modified])
+        time.sleep(0.05) # To let concurrent requests overlap
+
+        if not is_modified:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(CONTENT)))
+        self.end_headers()
+        self.wfile.write(CONTENT)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.folder = tempfile.TemporaryDirectory()
+        self.consts = {name: getattr(fs, name) for name in
+            ['CACHE_FOLDER', 'EXPORT_FOLDER', 'GDRIVE_URL', 'PHOTO_LOGO_URL']}
+        fs.EXPORT_FOLDER = os.path.join(self.folder.name, 'export')
+        fs.CACHE_FOLDER = os.path.join(fs.EXPORT_FOLDER, 'cache')
+        fs.GDRIVE_URL = f'http://127.0.0.1:{self.server.server_port}/uc'
+        fs.PHOTO_LOGO_URL = get_url('logo')
+
+        self.fs = fs.FS(is_new_folder=True)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for name, value in self.consts.items():
+            setattr(fs, name, value)
+        self.folder.cleanup()
+
+    def test_cache_hit(self):
+        fpath = self.fs.get_path('tmp/a.jpg')
+        self.assertFalse(self.fs.download(get_url('a'), fpath))
+        self.assertTrue(self.fs.download(get_url('a'), fpath))
+        self.assertEqual(self.server.requests, [['a', True]])
+        with open(fpath, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+
+    def test_revalidation(self):
+        fpath = self.fs.get_path('tmp/a.jpg')
+        self.fs.download(get_url('a'), fpath)
+
+        meta_path = os.path.join(fs.CACHE_FOLDER, 'a.json')
+        with open(meta_path, 'w') as f:
+            json.dump({'etag': ETAG, 'time': 0}, f)
+
+        self.assertFalse(self.fs.download(get_url('a'), fpath))
+        self.assertEqual(self.server.requests, [['a', True], ['a', False]])
+        with open(fpath, 'rb') as f:
+            self.assertEqual(f.read(), CONTENT)
+        with open(meta_path, 'r') as f:
+            self.assertGreater(json.load(f)['time'], 0)
+
+    def test_concurrent_duplicates(self):
+        persons = [(f'person{i}', get_url('same')) for i in range(8)]
+        self.fs.download_photos(persons)
+
+        uids = sorted(uid for uid, _ in self.server.requests)
+        self.assertEqual(uids, ['logo', 'same'])
+        for name, _ in persons:
+            with open(self.fs.get_path(f'tmp/{name}.jpg'), 'rb') as f:
+                self.assertEqual(f.read(), CONTENT)
+        self.assertFalse(any(f.endswith('.tmp')
+            for f in os.listdir(fs.CACHE_FOLDER)))
+
+
+def get_url(uid):
+    return f'https://drive.google.com/file/d/{uid}/view?usp=sharing'
+
+
+if __name__ == '__main__':
+    unittest.main()
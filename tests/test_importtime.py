@@ -0,0 +1,64 @@
+"""Tests of the imports of the subcommands (see "bench/bench_importtime.py").
+
+Run as "python -m unittest discover tests" from the root folder of the
+repository. Each subcommand is run in the fresh interpreter with the flag
+"-X importtime" (the commands which write the results are run in the
+temporary folder with the small synthetic data), and it must succeed without
+importing the heavy packages it does not need. The limits of the import time
+depend on the machine, hence they are checked only by the benchmark.
+
+"""
+import os
+import tempfile
+import unittest
+
+
+from bench.bench_importtime import check
+from bench.bench_importtime import CHECKS
+from bench.bench_importtime import gen_fixture
+from bench.bench_importtime import get_folder
+from bench.bench_importtime import ROOT
+
+
+class TestImportTime(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder_tmp = tempfile.TemporaryDirectory()
+        cls.folder_empty = os.path.join(cls.folder_tmp.name, 'empty')
+        cls.folder_fixture = os.path.join(cls.folder_tmp.name, 'fixture')
+        os.makedirs(cls.folder_empty)
+        gen_fixture(cls.folder_fixture)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder_tmp.cleanup()
+
+    def check(self, name):
+        checks = {item[0]: item for item in CHECKS}
+        _, command, _, modules_forbidden = checks[name]
+        folder = get_folder(name, ROOT, self.folder_empty,
+            self.folder_fixture)
+        self.assertEqual(check(name, command, None, modules_forbidden,
+            folder), [])
+
+    def test_import(self):
+        self.check('import')
+
+    def test_folder(self):
+        self.check('folder')
+
+    def test_journal(self):
+        self.check('journal')
+
+    def test_stats(self):
+        self.check('stats')
+
+    def test_export(self):
+        self.check('export')
+
+    def test_parse_wos(self):
+        self.check('parse-wos')
+
+
+if __name__ == '__main__':
+    unittest.main()
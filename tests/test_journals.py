@@ -0,0 +1,61 @@
+"""Tests of the approximate search of journals (see "TitleIndex").
+
+Run as "python -m unittest discover tests" from the root folder of the
+repository. The results of the index for the titles of the WoS reference
+file with typos (and for the short queries of several words) are compared
+with the brute force sort of all titles by the edit distance.
+
+"""
+import csv
+import os
+import random
+import unittest
+
+
+from journals import TitleIndex
+
+
+FPATH = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+    'journals', 'wos-jcr 2021-June-30.csv')
+
+
+class TestTitleIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(FPATH, 'r', encoding='utf-8') as f:
+            titles = [row['Title'] for row in csv.DictReader(f)]
+        cls.journals = [{'title': title} for title in titles]
+        cls.index = TitleIndex(cls.journals)
+
+    def check(self, query, count=10):
+        from Levenshtein import distance
+
+        key = query.lower()
+        res = sorted((distance(key, journal['title'].lower()), i)
+            for i, journal in enumerate(self.journals))[:count]
+        res = [[self.journals[i], dist] for dist, i in res]
+        self.assertEqual(self.index.search(query, count), res, query)
+
+    def test_typos(self):
+        rand = random.Random(0)
+        for journal in rand.sample(self.journals, 50):
+            title = list(journal['title'])
+            pos = rand.randrange(len(title))
+            title[pos] = rand.choice('abcdefghijklmnopqrstuvwxyz ')
+            self.check(''.join(title))
+
+    def test_words(self):
+        rand = random.Random(1)
+        words = [w for j in self.journals for w in j['title'].split()]
+        for _ in range(100):
+            self.check(' '.join(rand.sample(words, 2)))
+
+    def test_edge_cases(self):
+        for query in ['', 'x', 'NATURE', 'Journal of Machine Learning']:
+            self.check(query)
+        self.check('Nature', count=1)
+        self.assertEqual(TitleIndex([]).search('Nature'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
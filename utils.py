@@ -1,11 +1,291 @@
+import contextlib
+import hashlib
+import json
+import os
+import pickle
 import sys
+import time
 
 
-def load_sheet(sh, max_count=10000):
-    i = 1
+LOADER_VERSION = 2
+LOG = {'collect': 0}
+MEMORY = {'peak': 0.}
+PROFILE = []
+PROFILE_START = time.perf_counter()
+SPANS = []
+
+
+try:
+    import resource
+except ImportError: # The module is not available on Windows
+    resource = None
+
+
+class LogError(Exception):
+    """Error logged by "log" while errors are collected (see "collect")."""
+
+
+class Span():
+    def __init__(self, name, **info):
+        """Span of the run (stage) for the profile.
+
+        Args:
+            name (str): the name of the stage (e.g., "export_word_cv").
+            info: the additional info for the profile (e.g., uid=...).
+
+        Note:
+            The span may be entered (as the context manager) many times, and
+            the wall time and the CPU time of the process are accumulated for
+            all entries, hence, e.g., the stages which are interleaved in one
+            loop may be measured separately. The RSS of the process is saved
+            at the first entry and at the last exit (see "get_memory"), and
+            the peak RSS is saved for the time inside the span (the peak is
+            reset at each entry, see "reset_memory_peak"), and the exception
+            raised in the span is saved as its error. The
+            number of processed items should be set (or increased) in the
+            attribute "count". The span is saved into the profile (and
+            logged) by the call of "close". In most cases the function "span"
+            should be used instead.
+
+        """
+        self.name = name
+        self.info = info
+        self.count = 0
+        self.calls = 0
+        self.start = None
+        self.time = 0.
+        self.time_cpu = 0.
+        self.memory_start = None
+        self.memory_end = None
+        self.memory_peak = None
+        self.error = None
+
+    def __enter__(self):
+        self.t = time.perf_counter()
+        self.t_cpu = time.process_time()
+        if self.start is None:
+            self.start = self.t - PROFILE_START
+            self.memory_start = get_memory()
+        reset_memory_peak()
+        SPANS.append(self)
+        self.calls += 1
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        self.time += time.perf_counter() - self.t
+        self.time_cpu += time.process_time() - self.t_cpu
+        self.memory_end = get_memory()
+        SPANS.remove(self)
+        memory = get_memory_hwm()
+        if memory is not None:
+            self.memory_peak = max(self.memory_peak or 0., memory)
+        if value is not None:
+            self.error = f'{kind.__name__}: {value}'
+
+    def close(self):
+        """Save the span into the profile and log it (the kind "prf")."""
+        item = {
+            'name': self.name,
+            'start': self.start,
+            'time': self.time,
+            'time_cpu': self.time_cpu,
+            'memory_start': self.memory_start,
+            'memory_end': self.memory_end,
+            'memory_peak': self.memory_peak,
+            'count': self.count,
+            'calls': self.calls,
+            'error': self.error,
+            **self.info,
+        }
+        PROFILE.append(item)
+
+        text = f'Stage "{self.name}"'
+        if len(self.info):
+            text += ' (' + ', '.join(f'{name}={value}'
+                for name, value in self.info.items()) + ')'
+        text += f' [{self.time:.2f} sec.; CPU {self.time_cpu:.2f} sec.'
+        if self.memory_start is not None and self.memory_end is not None:
+            text += f'; RSS {self.memory_start:.1f} -> {self.memory_end:.1f} MB'
+        if self.memory_peak is not None:
+            text += f' (peak {self.memory_peak:.1f} MB)'
+        text += f'; {self.count} items]'
+        if self.error is not None:
+            text += f' failed ({self.error})'
+        log(text, 'prf')
+
+        return item
+
+
+@contextlib.contextmanager
+def collect():
+    """Raise "LogError" for errors logged in the block instead of the exit.
+
+    Note:
+        By default the call of "log" with the kind "err" shuts down the
+        system. Inside this context the error is raised as the exception,
+        hence it may be caught and collected by the caller (e.g., the failed
+        report is skipped, and other reports of the batch are built).
+
+    """
+    LOG['collect'] += 1
+    try:
+        yield
+    finally:
+        LOG['collect'] -= 1
+
+
+def get_memory():
+    """Return the current resident set size (RSS) of the process in MB.
+
+    Note:
+        The RSS is read from "/proc/self/statm" (on Linux). If it is not
+        available, then the peak RSS is returned (see "get_memory_hwm").
+
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return get_memory_hwm()
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+
+
+def get_memory_hwm():
+    """Return the peak RSS of the process since the last reset in MB.
+
+    Note:
+        The peak is read from "/proc/self/status" (on Linux), otherwise it
+        is the peak RSS of the process since its start (see "getrusage").
+
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    if resource is None:
+        return
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == 'darwin' else rss / 1024
+
+
+def get_memory_peak():
+    """Return the peak resident set size (RSS) of the process in MB."""
+    memory = get_memory_hwm()
+    if memory is None:
+        return
+    return max(MEMORY['peak'], memory)
+
+
+def hash_data(data):
+    data = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha1(data).hexdigest()
+
+
+def hash_file(fpath, chunk_size=1048576):
+    h = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def iter_span(sp, items):
+    """Yield items measuring the time of the iteration in the span."""
+    items = iter(items)
+    while True:
+        with sp:
+            item = next(items, sp)
+        if item is sp:
+            return
+        sp.count += 1
+        yield item
+
+
+def load_book(fpath, names):
+    """Load the given sheets from the excel file.
+
+    Note:
+        The workbook is opened in the read-only mode and each sheet is
+        streamed once (see "load_sheet"). The time of loading and the peak
+        RSS of the process are logged for each sheet. The names of sheets
+        are case insensitive, and missing sheets are loaded as empty tables.
+
+    """
+    import openpyxl
+
+    t = time.perf_counter()
+    wb = openpyxl.load_workbook(fpath, read_only=True)
+    log(f'Excel file "{fpath}" is opened' + log_perf(t), 'res')
+
+    sheets = {sheet.lower(): sheet for sheet in wb.sheetnames}
+
+    data = {}
+    for name in names:
+        if not name.lower() in sheets:
+            log(f'Sheet "{name}" is not found (it is skipped)', 'wrn')
+            data[name] = {}
+            continue
+
+        t = time.perf_counter()
+        data[name] = load_sheet(wb[sheets[name.lower()]])
+        text = f'Sheet "{name}" is loaded ({len(data[name])} rows)'
+        log(text + log_perf(t), 'res')
+
+    wb.close()
+    return data
+
+
+def load_book_cached(fpath, names, cache_path):
+    """Load the given sheets from the excel file using the binary cache.
+
+    Note:
+        The parsed sheets are saved as a pickle snapshot in the file
+        "cache_path" together with the hash of the content of the excel
+        file and the version of the loader. If the excel file (or the
+        loader) is changed, then the snapshot is rebuilt automatically.
+
+    Returns:
+        tuple: the dict of sheets and the key of the excel file (the hash of
+        its content and the version of the loader), which may be used as the
+        key of the data derived from the file (the same for all sheets).
+
+    """
+    key_file = [hash_file(fpath), LOADER_VERSION]
+    key = key_file + [list(names)]
+
+    if os.path.isfile(cache_path):
+        t = time.perf_counter()
+        try:
+            with open(cache_path, 'rb') as f:
+                cache = pickle.load(f)
+        except Exception:
+            cache = {}
+        if cache.get('key') == key:
+            text = f'Excel file "{fpath}" is loaded from cache'
+            log(text + log_perf(t), 'res')
+            return cache['data'], key_file
+
+    data = load_book(fpath, names)
+
+    with open(cache_path + '.tmp', 'wb') as f:
+        pickle.dump({'key': key, 'data': data}, f, pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_path + '.tmp', cache_path)
+    log(f'Cache file "{cache_path}" is saved', 'res')
+
+    return data, key_file
+
+
+def load_sheet(sh):
+    if hasattr(sh, 'reset_dimensions'):
+        sh.reset_dimensions() # Dimensions in the file may be incorrect
+
+    rows = sh.iter_rows(values_only=True)
+
     fields = []
-    for j in range(1, max_count):
-        field = sh.cell(i, j).value
+    for field in next(rows, ()):
         if field is None or not field or field == ' ':
             break
 
@@ -14,14 +294,13 @@ def load_sheet(sh, max_count=10000):
         fields.append(field)
 
     table = {}
-    for i in range(2, max_count):
-        uid = sh.cell(i, 1).value
+    for values in rows:
+        uid = values[0] if len(values) else None
         if uid is None or not uid or uid == ' ':
             break
 
         row = {}
-        for j, field in enumerate(fields, 1):
-            value = sh.cell(i, j).value
+        for field, value in zip(fields, values):
             if value is not None and value != ' ':
                 row[field] = value
 
@@ -37,5 +316,77 @@ def log(text, kind='err'):
     res += text
     print(res)
     if kind == 'err':
+        if LOG['collect'] > 0:
+            raise LogError(text)
         log('The system will shut down due to an error', 'wrn')
         sys.exit(0)
+
+
+def log_perf(t):
+    text = f' [{time.perf_counter() - t:.2f} sec.'
+    memory = get_memory_peak()
+    if memory is not None:
+        text += f'; peak RSS {memory:.1f} MB'
+    return text + ']'
+
+
+def reset_memory_peak():
+    """Reset the peak RSS of the process (see "get_memory_hwm").
+
+    Note:
+        The peak is reset by the write to "/proc/self/clear_refs" (on Linux
+        since 4.0). The peak before the reset is kept for the peak of the
+        process (see "get_memory_peak") and for the peaks of the entered
+        spans (hence the nested spans are measured correctly). If the peak
+        can not be reset, then the spans have the peak of the process.
+
+    """
+    memory = get_memory_hwm()
+    if memory is None:
+        return
+    MEMORY['peak'] = max(MEMORY['peak'], memory)
+    for sp in SPANS:
+        sp.memory_peak = max(sp.memory_peak or 0., memory)
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def save_profile(fpath):
+    """Save the profile of the run (all closed spans) into the json file."""
+    data = {
+        'argv': sys.argv,
+        'time': time.perf_counter() - PROFILE_START,
+        'memory_peak': get_memory_peak(),
+        'spans': PROFILE,
+    }
+    with open(fpath + '.tmp', 'w') as f:
+        json.dump(data, f, indent=4, default=str)
+    os.replace(fpath + '.tmp', fpath)
+    log(f'Profile of the run is saved to "{fpath}"', 'res')
+
+
+@contextlib.contextmanager
+def span(name, **info):
+    """Measure the stage of the run as the context manager (see "Span").
+
+    Note:
+        The wall time, the CPU time, the RSS of the process at the start and
+        at the end of the block, the peak RSS in the block and the number of
+        processed items (it should be set in the attribute "count" of the
+        yielded span) are logged with the kind "prf" at the end of the block
+        (also if it is failed, then the error is saved too), and they are
+        saved into the profile of the run (see "save_profile"), e.g.:
+            with span('export_stat', format='png') as sp:
+                ...
+                sp.count = len(authors)
+
+    """
+    sp = Span(name, **info)
+    try:
+        with sp:
+            yield sp
+    finally:
+        sp.close()
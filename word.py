@@ -4,31 +4,37 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.enum.table import WD_ALIGN_VERTICAL
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.shared import Inches
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
 from docx.shared import Mm, Cm, Pt
+import io
+import os
+import re
+from xml.sax.saxutils import escape
+
+
+XML_HYPERLINK = '<w:r><w:rPr><w:color w:val="000000" w:themeColor="hyperlink"/><w:u w:val="single"/></w:rPr><w:hyperlink r:id="{r_id}"><w:r><w:rPr/>{content}</w:r></w:hyperlink></w:r>'
+XML_PARAGRAPH = '<w:p><w:pPr><w:pStyle w:val="{style}"/>{ppr}</w:pPr>{runs}</w:p>'
+
+
+TEMPLATES = {}
+NOTES = {}
 
 
 class Word():
-    def __init__(self, years, get_papers):
+    def __init__(self, years, get_papers, photo_logo=None):
         self.years = years
         self.get_papers = get_papers
 
-        self.document = docx.Document()
+        template = get_template(photo_logo)
+        self.document = docx.Document(io.BytesIO(template))
 
         self.style_normal = self.document.styles['Normal']
-        self.style_normal.font.name = 'Cambria'
-        self.style_normal.font.size = Pt(12)
-
-        self.style_title_name = self.document.styles.add_style('TitleName',
-            WD_STYLE_TYPE.PARAGRAPH)
-        self.style_title_name.base_style = self.style_normal
-        self.style_title_name.font.name = 'Bookman Old Style'
-        self.style_title_name.font.size = Pt(20)
+        self.style_title_name = self.document.styles['TitleName']
+        self.table_stat_title = self.document.styles['TableStatTitle']
 
-        self.table_stat_title = self.document.styles.add_style('TableStatTitle',
-            WD_STYLE_TYPE.PARAGRAPH)
-        self.table_stat_title.base_style = self.style_normal
-        self.table_stat_title.font.name = 'Bookman Old Style'
-        self.table_stat_title.font.size = Pt(12)
+        self.rel_ids = {}
+        self.style_ids = {}
 
     def add_break(self):
         self.document.add_page_break()
@@ -66,20 +72,25 @@ class Word():
         table.rows[4].cells[1].text = grant.get('acknowledgement', '')
 
     def add_note(self, is_grant=False):
-        self.document.add_paragraph('\n\n')
-        text = 'This document is generated automatically. '
-        text += 'Journal ratings were determined based on the '
-        text += 'Scimago Journal & Country Rank. All publications '
-        text += 'in the collected database will be manually checked later. '
-        if is_grant:
-            text += '\n\nNOTE! We use bold type for all authors associated with our center. This will be clarified later (only authors participating in the corresponding grant will be displayed in bold).'
-        p = self.document.add_paragraph(text, style='Intense Quote')
-        p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-
-    def add_paper_list(self, stat, author=None, grant=None, with_links=False):
+        if not is_grant in NOTES:
+            text = compose_note(is_grant)
+            NOTES[is_grant] = [
+                '<w:p>' + get_run_xml('\n\n') + '</w:p>',
+                XML_PARAGRAPH.format(style=self.get_style_id('Intense Quote'),
+                    ppr='<w:jc w:val="both"/>', runs=get_run_xml(text)),
+            ]
+
+        self.add_xml(NOTES[is_grant])
+
+    def add_paper_list(self, stat, author=None, grant=None, with_links=False,
+                       quartiles=[1, 2, 0], is_bulk=True):
+        if is_bulk:
+            return self.add_paper_list_bulk(stat, author, grant, with_links,
+                quartiles)
+
         self.document.add_heading('Publications', level=1)
 
-        for q in [1, 2, 0]:
+        for q in quartiles:
             if stat['total'][f'q{q}'] == 0:
                 continue
             if q == 1:
@@ -134,6 +145,60 @@ class Word():
 
             p.add_run('\n\n')
 
+    def add_paper_list_bulk(self, stat, author=None, grant=None,
+                            with_links=False, quartiles=[1, 2, 0]):
+        """Add the list of papers as in "add_paper_list" in the bulk mode.
+
+        Note:
+            The xml of all paragraphs of the list is composed as one string
+            from the escaped text fragments (the runs are the same as the
+            runs which are added by python-docx in "add_paper_list"), and
+            then it is parsed once and appended to the document body. The
+            ids of styles and hyperlink relationships are cached, hence the
+            resulting document is exactly the same, but it is built much
+            faster for long lists of papers.
+
+        """
+        self.document.add_heading('Publications', level=1)
+
+        items = []
+        ind_last = None # Index of the last paragraph with the paper
+        for q in quartiles:
+            if stat['total'][f'q{q}'] == 0:
+                continue
+            if q == 1:
+                text = 'Publications in Q1-rated journals'
+            elif q == 2:
+                text = 'Publications in Q2-rated journals'
+            else:
+                text = 'Other publications'
+            items.append(self.get_heading_xml(text, level=3))
+
+            for year in self.years[::-1]:
+                if stat[year][f'q{q}'] == 0:
+                    continue
+
+                papers = self.get_papers(author, year, q, grant)
+
+                items.append(self.get_heading_xml('Year ' + str(year), 5))
+
+                for paper in papers.values():
+                    items.append(self.get_paper_xml(paper, author, with_links))
+                    ind_last = len(items) - 1
+
+            if ind_last is not None:
+                items[ind_last] = items[ind_last][:-6] + get_run_xml('\n\n')
+                items[ind_last] += '</w:p>'
+
+        self.add_xml(items)
+
+    def add_xml(self, items):
+        """Append paragraphs (the list of xml strings) to the document."""
+        xml = f'<w:body {nsdecls("w", "r")}>' + ''.join(items) + '</w:body>'
+        body = self.document.element.body
+        for p in list(parse_xml(xml)):
+            body._insert_p(p)
+
     def add_person_info(self, person, photo_person=None, photo_logo=None):
         table = self.document.add_table(rows=1, cols=2)
         table.rows[0].cells[0].width = Cm(7.5)
@@ -204,7 +269,7 @@ class Word():
 
     def add_person_stat(self, stat):
         self.document.add_paragraph('\n\n')
-        table = self.document.add_table(rows=5, cols=7)
+        table = self.document.add_table(rows=5, cols=len(self.years)+2)
         table.rows[0].cells[0].width = Cm(5)
         table.style = 'Table Grid'
 
@@ -213,7 +278,9 @@ class Word():
             p.style = self.table_stat_title
             p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
             p.add_run(str(year))
-        p = table.rows[0].cells[6].paragraphs[0]
+        n = len(self.years) + 1
+
+        p = table.rows[0].cells[n].paragraphs[0]
         p.style = self.table_stat_title
         p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         p.add_run('Total').bold = True
@@ -245,20 +312,79 @@ class Word():
             p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
             p.add_run(str(stat[year]['total']))
 
-        p = table.rows[1].cells[6].paragraphs[0]
+        p = table.rows[1].cells[n].paragraphs[0]
         p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         p.add_run(str(stat['total']['q1']))
-        p = table.rows[2].cells[6].paragraphs[0]
+        p = table.rows[2].cells[n].paragraphs[0]
         p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         p.add_run(str(stat['total']['q2']))
-        p = table.rows[3].cells[6].paragraphs[0]
+        p = table.rows[3].cells[n].paragraphs[0]
         p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         p.add_run(str(stat['total']['q0']))
-        p = table.rows[4].cells[6].paragraphs[0]
+        p = table.rows[4].cells[n].paragraphs[0]
         p.paragraph_format.alignment = WD_ALIGN_PARAGRAPH.RIGHT
         p.add_run(str(stat['total']['total']))
 
+    def get_heading_xml(self, text, level=1):
+        style = self.get_style_id('Heading %d' % level)
+        return XML_PARAGRAPH.format(style=style, ppr='',
+            runs=get_run_xml(text))
+
+    def get_paper_xml(self, paper, author=None, with_links=False):
+        journal = paper['journal_object']
+
+        runs = []
+
+        authors = paper['authors'].split(', ')
+        authors_parsed = paper['authors_parsed'].split(', ')
+
+        for i in range(len(authors)):
+            bold = False
+            if authors_parsed[i] in (author or ''):
+                bold = True
+            if not author and authors_parsed[i][0] == '#':
+                bold = True
+            runs.append(get_run_xml(authors[i], '<w:b/>' if bold else ''))
+            if i < len(authors)-1:
+                runs.append(get_run_xml(', '))
+            else:
+                runs.append(get_run_xml('. '))
+
+        runs.append(get_run_xml(paper['year'] + '. '))
+        runs.append(get_run_xml(paper['title'] + '. '))
+        runs.append(get_run_xml(paper['journal'] + '. ', '<w:i/>'))
+        runs.append(get_run_xml(compose_paper_nums(paper)))
+        if with_links:
+            v = paper.get('screen')
+            if v and len(v) > 2:
+                runs.append(get_run_xml(' // '))
+                runs.append(XML_HYPERLINK.format(r_id=self.get_rel_id(v),
+                    content=get_run_content_xml('Screenshot Publisher')))
+            v = journal.get('screen_wos')
+            if v and len(v) > 2:
+                runs.append(get_run_xml(' // '))
+                runs.append(XML_HYPERLINK.format(r_id=self.get_rel_id(v),
+                    content=get_run_content_xml('Screenshot WoS')))
+
+        return XML_PARAGRAPH.format(style=self.get_style_id('List Bullet'),
+            ppr='<w:jc w:val="both"/>', runs=''.join(runs))
+
+    def get_rel_id(self, url):
+        if not url in self.rel_ids:
+            self.rel_ids[url] = self.document.part.relate_to(url,
+                docx.opc.constants.RELATIONSHIP_TYPE.HYPERLINK,
+                is_external=True)
+        return self.rel_ids[url]
+
+    def get_style_id(self, name):
+        if not name in self.style_ids:
+            self.style_ids[name] = self.document.part.get_style_id(name,
+                WD_STYLE_TYPE.PARAGRAPH)
+        return self.style_ids[name]
+
     def save(self, file_path):
+        # Margins are set at the end, since the widths of tables are computed
+        # for the default margins of the section:
         for section in self.document.sections:
             section.top_margin = Cm(2)
             section.bottom_margin = Cm(2)
@@ -294,6 +420,87 @@ def add_hyperlink(paragraph, text, url):
     return hyperlink
 
 
+def build_template(photo_logo=None):
+    document = docx.Document()
+
+    style_normal = document.styles['Normal']
+    style_normal.font.name = 'Cambria'
+    style_normal.font.size = Pt(12)
+
+    style_title_name = document.styles.add_style('TitleName',
+        WD_STYLE_TYPE.PARAGRAPH)
+    style_title_name.base_style = style_normal
+    style_title_name.font.name = 'Bookman Old Style'
+    style_title_name.font.size = Pt(20)
+
+    table_stat_title = document.styles.add_style('TableStatTitle',
+        WD_STYLE_TYPE.PARAGRAPH)
+    table_stat_title.base_style = style_normal
+    table_stat_title.font.name = 'Bookman Old Style'
+    table_stat_title.font.size = Pt(12)
+
+    if photo_logo:
+        document.part.get_or_add_image(photo_logo)
+
+    f = io.BytesIO()
+    document.save(f)
+    return f.getvalue()
+
+
+def get_run_content_xml(text):
+    """Return the xml of the content of the run (as python-docx does)."""
+    content = ''
+    for part in re.split(r'([\t\r\n])', text):
+        if part == '\t':
+            content += '<w:tab/>'
+        elif part in ['\r', '\n']:
+            content += '<w:br/>'
+        elif part:
+            space = ' xml:space="preserve"' if part.strip() != part else ''
+            content += f'<w:t{space}>{escape(part)}</w:t>'
+    return content
+
+
+def get_run_xml(text, rpr=''):
+    content = get_run_content_xml(text)
+    if rpr:
+        return f'<w:r><w:rPr>{rpr}</w:rPr>{content}</w:r>'
+    if content:
+        return f'<w:r>{content}</w:r>'
+    return '<w:r/>'
+
+
+def get_template(photo_logo=None):
+    """Return the base template of documents (the content of docx file).
+
+    Note:
+        The template with the styles and the image part of the logo (if it
+        is given) is built once in each process, and then each document is
+        loaded from this template in memory. The template is cached by the
+        path, the size and the modification time of the logo file, hence it
+        is rebuilt if the logo is changed. Since the logo is already embedded
+        in the template, "add_picture" for the logo reuses its image part.
+
+    """
+    key = photo_logo
+    if photo_logo:
+        stat = os.stat(photo_logo)
+        key = (photo_logo, stat.st_size, stat.st_mtime_ns)
+    if not key in TEMPLATES:
+        TEMPLATES[key] = build_template(photo_logo)
+    return TEMPLATES[key]
+
+
+def compose_note(is_grant=False):
+    text = 'This document is generated automatically. '
+    text += 'Journal ratings were determined based on the '
+    text += 'Scimago Journal & Country Rank. All publications '
+    text += 'in the collected database will be manually checked later. '
+    if is_grant:
+        text += '\n\nNOTE! We use bold type for all authors associated with our center. This will be clarified later (only authors participating in the corresponding grant will be displayed in bold).'
+    return text
+
+
 def compose_paper_nums(paper, end='.'):
     volume = paper.get('volume')
     number = paper.get('number')